@@ -1,6 +1,6 @@
 import os
 import streamlit as st
-import uuid
+import secrets
 from typing import List, Dict, Any
 
 # Langchain and LangGraph Imports
@@ -16,22 +16,31 @@ from typing_extensions import TypedDict
 
 # Environment Setup
 from dotenv import load_dotenv
-load_dotenv()
 
-# Configuration and API Key Validation
-GROQ_KEY = os.getenv("GROQ")
-TAVILY_KEY = os.getenv("TAVILY")
-LANGCHAIN_KEY = os.getenv("LANGCHAIN")
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    """Read .env and export provider settings once per process, not on every rerun"""
+    load_dotenv()
+    
+    # Configuration and API Key Validation
+    groq_key = os.getenv("GROQ")
+    tavily_key = os.getenv("TAVILY")
+    langchain_key = os.getenv("LANGCHAIN")
+    
+    # Set environment variables
+    if all([groq_key, tavily_key, langchain_key]):
+        os.environ["LANGCHAIN_API_KEY"] = langchain_key
+        os.environ["LANGCHAIN_TRACING_V2"] = "true"
+        os.environ["TAVILY_API_KEY"] = tavily_key
+    
+    return groq_key, tavily_key, langchain_key
+
+GROQ_KEY, TAVILY_KEY, LANGCHAIN_KEY = load_environment()
 
 if not all([GROQ_KEY, TAVILY_KEY, LANGCHAIN_KEY]):
     st.error("❌ Missing required API keys. Check your .env file.")
     st.stop()
 
-# Set environment variables
-os.environ["LANGCHAIN_API_KEY"] = LANGCHAIN_KEY
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["TAVILY_API_KEY"] = TAVILY_KEY
-
 # State Definition
 class State(TypedDict):
     messages: Annotated[List[Any], add_messages]
@@ -62,7 +71,7 @@ class AIAssistant:
         self.graph_builder.add_node("chatbot", self.chatbot)
         
         # Add tool node
-        tool_node = ToolNode(tools=self.tools)
+        tool_node = ToolNode(tools=self.tools, handle_tool_errors=True)
         self.graph_builder.add_node("tools", tool_node)
         
         # Set up conditional edges
@@ -84,9 +93,6 @@ class AIAssistant:
             # Invoke LLM with current conversation context
             message = self.llm_with_tools.invoke(messages)
             
-            # Ensure only one tool call at a time
-            assert len(message.tool_calls) <= 1
-            
             return {"messages": [message]}
         except Exception as e:
             return {"messages": [AIMessage(content=f"Error: {str(e)}")]}
@@ -99,19 +105,32 @@ class AIAssistant:
             events = self.graph.stream(
                 {"messages": [HumanMessage(content=user_input)]},
                 config,
-                stream_mode="values"
+                stream_mode="updates"
             )
             
-            # Collect final response
+            # Collect final response from the chatbot node's deltas
             final_response = None
-            for event in events:
-                if "messages" in event:
-                    final_response = event["messages"][-1]
+            for update in events:
+                for node_name, node_state in update.items():
+                    if node_name == "chatbot":
+                        final_response = node_state["messages"][-1]
             
             return final_response
         except Exception as e:
             return AIMessage(content=f"Conversation error: {str(e)}")
 
+@st.cache_resource(show_spinner=False)
+def get_assistant(temperature: float, model: str):
+    """Build the assistant once per (temperature, model) and reuse it across reruns"""
+    return AIAssistant(temperature=temperature)
+
+def init_session_state():
+    """Initialize all session state variables"""
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = []
+    if "thread_id" not in st.session_state:
+        st.session_state.thread_id = secrets.token_hex(8)
+
 def main():
     # Configure Page
     st.set_page_config(
@@ -120,6 +139,9 @@ def main():
         layout="wide"
     )
 
+    # Initialize session state variables
+    init_session_state()
+
     # Sidebar Configuration
     with st.sidebar:
         st.title("🧠 AI Assistant Controls")
@@ -127,6 +149,7 @@ def main():
         # Conversation Management
         if st.button("🔄 Reset Conversation", use_container_width=True):
             st.session_state.chat_history = []
+            st.session_state.thread_id = secrets.token_hex(8)
             st.rerun()
        
         # Model Settings
@@ -180,15 +203,8 @@ def main():
     st.title("🤖 AI Assistant")
     st.caption("Intelligent Conversational AI")
 
-    # Create AI Assistant
-    assistant = AIAssistant(temperature=temperature/10)
-    
-    # Unique conversation thread
-    thread_id = str(uuid.uuid4())
-    
-    # Initialize chat history
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    # Reuse the cached AI Assistant
+    assistant = get_assistant(temperature/10, model_choice)
     
     # Chat Container
     chat_container = st.container()
@@ -209,18 +225,19 @@ def main():
     if user_input:
         # Add user message to history
         st.session_state.chat_history.append(HumanMessage(content=user_input))
+        with st.chat_message("human", avatar="👤"):
+            st.markdown(user_input)
         
         with st.spinner("Analyzing your query..."):
             try:
                 # Process input through AI assistant
-                response = assistant.run_conversation(user_input, thread_id)
+                response = assistant.run_conversation(user_input, st.session_state.thread_id)
                 
-                # Add AI response to history
+                # Add AI response to history and show it without another rerun
                 if response:
                     st.session_state.chat_history.append(response)
-                
-                # Rerun to update the chat container
-                st.rerun()
+                    with st.chat_message("assistant", avatar="🤖"):
+                        st.markdown(response.content)
             
             except Exception as e:
                 st.error(f"An error occurred: {e}")
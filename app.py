@@ -1,55 +1,260 @@
 # app.py
 import os
 import streamlit as st
-import uuid
+import secrets
 import sys
 import platform
+import contextvars
+import re
+import threading
+import queue
+import concurrent.futures
+from collections import OrderedDict
 from typing import List, Any, Annotated
 from langchain_groq import ChatGroq
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_core.messages import AIMessage, HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_community.chat_message_histories import StreamlitChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import StateGraph, START
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
 from typing_extensions import TypedDict
+from pydantic import PrivateAttr
+import aiosqlite
+import httpx
 import nest_asyncio
 import traceback
-from browser_client import BrowserAutomationClient
 import asyncio
 
 # Enable nested asyncio to run async functions inside Streamlit
 nest_asyncio.apply()
 
 from dotenv import load_dotenv  # noqa: E402
-load_dotenv()
 
-# Load all required API keys
-GROQ_KEY = os.getenv("GROQ")
-TAVILY_KEY = os.getenv("TAVILY")
-LANGCHAIN_KEY = os.getenv("LANGCHAIN")
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    """Read .env and export provider settings once per process, not on every rerun"""
+    load_dotenv()
+    
+    # Load all required API keys
+    groq_key = os.getenv("GROQ")
+    tavily_key = os.getenv("TAVILY")
+    langchain_key = os.getenv("LANGCHAIN")
+    
+    # Set environment variables
+    os.environ["LANGCHAIN_API_KEY"] = langchain_key or ""
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    os.environ["TAVILY_API_KEY"] = tavily_key or ""
+    
+    return groq_key, tavily_key, langchain_key
 
-# Set environment variables
-os.environ["LANGCHAIN_API_KEY"] = LANGCHAIN_KEY or ""
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["TAVILY_API_KEY"] = TAVILY_KEY or ""
+GROQ_KEY, TAVILY_KEY, LANGCHAIN_KEY = load_environment()
 
 # === Fix for Windows asyncio subprocess issue ===
-if platform.system() == "Windows":
-    import asyncio
+# Streamlit re-executes this script on every rerun, so only do this once per process
+if platform.system() == "Windows" and not getattr(sys, "_mm_loop_inited", False):
     if sys.version_info[0] == 3 and sys.version_info[1] >= 8:
-        # For Python 3.8+
+        # For Python 3.8+; the shared background loop below is created with this policy
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        
-        # Create event loop explicitly for Windows
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
     else:
         # For older Python versions
         loop = asyncio.ProactorEventLoop()
         asyncio.set_event_loop(loop)
+    sys._mm_loop_inited = True
+
+@st.cache_resource(show_spinner=False)
+def get_background_loop():
+    """
+    Process-wide event loop for all async work. Streamlit starts a new script
+    thread for most reruns, so a shared loop is what lets pooled HTTP
+    connections be reused across reruns and sessions.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="mini-manus-loop", daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Run a coroutine on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    """Shared keep-alive HTTP/2 client for the Groq models"""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+
+# How long a paused task waits for the user; longer than the service's own
+# 300 s INPUT_TIMEOUT, after which the service has moved on anyway
+ANSWER_TIMEOUT = 330
+
+class BrowserTaskRunner:
+    """
+    Runs a browser task on a background event loop. When the service asks
+    a question the task pauses on an asyncio.Event until answer() is called,
+    instead of restarting the whole task on the next Streamlit rerun.
+    """
+    
+    def __init__(self, loop, client, task):
+        self.loop = loop
+        self.question = None
+        self._answer = ""
+        self._answer_event = None
+        self._cancelled = False
+        self._updated = threading.Event()
+        self.future = asyncio.run_coroutine_threadsafe(self._run(client, task), loop)
+        self.future.add_done_callback(lambda _: self._updated.set())
+    
+    async def _run(self, client, task):
+        # The client is blocking, so keep it off the loop that handles answers
+        return await asyncio.to_thread(client.run_task, task, input_callback=self._input_callback)
+    
+    async def _ask(self, question):
+        if self._cancelled:
+            return ""
+        self._answer_event = asyncio.Event()
+        self.question = question
+        self._updated.set()
+        await self._answer_event.wait()
+        return self._answer
+    
+    def _input_callback(self, question):
+        # Called from the client's worker thread; blocks until the user answers,
+        # the runner is cancelled, or ANSWER_TIMEOUT passes with an empty answer
+        future = asyncio.run_coroutine_threadsafe(self._ask(question), self.loop)
+        try:
+            return future.result(timeout=ANSWER_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.question = None
+            return ""
+    
+    def done(self):
+        return self.future.done()
+    
+    def result(self):
+        return self.future.result()
+    
+    def wait(self):
+        """Block until the task asks a question or finishes"""
+        while self.question is None and not self.done():
+            self._updated.wait(timeout=1)
+            self._updated.clear()
+    
+    def answer(self, text):
+        """Resume the paused task with the user's answer"""
+        self._answer = text
+        self.question = None
+        if self._answer_event is not None:
+            self.loop.call_soon_threadsafe(self._answer_event.set)
+    
+    def cancel(self):
+        """Release a pending question with an empty answer, e.g. when the chat is reset"""
+        self._cancelled = True
+        self.answer("")
+
+# SQLite file holding LangGraph checkpoints for every conversation thread
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.db")
+
+@st.cache_resource(show_spinner=False)
+def get_checkpointer():
+    """Open the checkpoint database once; state then survives reruns and restarts"""
+    async def open_saver():
+        # The connection must live on the loop that runs the graph
+        conn = await aiosqlite.connect(CHECKPOINT_DB)
+        return AsyncSqliteSaver(conn)
+    return run_async(open_saver())
+
+@st.cache_resource(show_spinner=False)
+def get_graph_cache():
+    """Compiled graphs keyed by tool names and temperature, shared across reruns"""
+    return {}
+
+# Number of recent messages sent verbatim; older turns are folded into a summary
+HISTORY_WINDOW = 10
+
 class State(TypedDict):
     messages: Annotated[List[Any], add_messages]
+    summary: str
+    summarized: int
+
+# Short chit-chat and bare arithmetic never need a web search
+SMALL_TALK_PATTERN = re.compile(r"^(hi|hello|hey|thanks|thank you|bye|ok|okay|yes|no)\b", re.IGNORECASE)
+ARITHMETIC_PATTERN = re.compile(r"[\d\s+\-*/().]+")
+
+@st.cache_resource(show_spinner=False)
+def get_search_result_count():
+    """Tavily result count for the current turn; short queries need fewer results"""
+    # Cached so tools and assistants built on earlier reruns see the same variable
+    return contextvars.ContextVar("search_result_count", default=5)
+
+search_result_count = get_search_result_count()
+
+class CachedTavilySearch(TavilySearchResults):
+    """Tavily search that reuses results for repeated queries"""
+    cache_size: int = 256
+    _cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+
+    def _sized(self):
+        """Return a copy of the tool using the current turn's result count"""
+        max_results = search_result_count.get()
+        if max_results == self.max_results:
+            return self
+        return self.model_copy(update={"max_results": max_results})
+
+    def _lookup(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _store(self, key, result):
+        # Tavily errors come back as a string; don't cache those
+        content = result[0] if isinstance(result, tuple) else result
+        if isinstance(content, str):
+            return
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _run(self, query: str, run_manager=None):
+        tool = self._sized()
+        key = (query.strip().lower(), tool.max_results)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = TavilySearchResults._run(tool, query, run_manager=run_manager)
+        self._store(key, result)
+        return result
+
+    async def _arun(self, query: str, run_manager=None):
+        tool = self._sized()
+        key = (query.strip().lower(), tool.max_results)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = await TavilySearchResults._arun(tool, query, run_manager=run_manager)
+        self._store(key, result)
+        return result
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_bound_llm(temperature: float):
+    """
+    Build the LLM, tools and tool-bound LLM once per temperature. Kept in
+    st.cache_resource because the script module, and any lru_cache in it,
+    is re-executed on every rerun.
+    """
+    llm = ChatGroq(
+        temperature=temperature,
+        model_name="llama-3.3-70b-versatile",
+        groq_api_key=GROQ_KEY,
+        streaming=True,
+        http_async_client=get_http_client()
+    )
+    tools = (CachedTavilySearch(max_results=5),) if TAVILY_KEY else ()
+    return llm, tools, llm.bind_tools(list(tools))
 
 class AIAssistant:
     def __init__(self, temperature=0.3):
@@ -57,30 +262,33 @@ class AIAssistant:
             st.error("❌ Missing GROQ API key for conversational mode. Check your .env file.")
             return
             
-        self.llm = ChatGroq(
-            temperature=temperature,
-            model_name="llama-3.3-70b-versatile",
-            groq_api_key=GROQ_KEY
-        )
-        
         if not TAVILY_KEY:
             st.warning("⚠️ Missing TAVILY API key. Search functionality will be limited.")
-            self.search_tool = None
-            self.tools = []
-        else:
-            self.search_tool = TavilySearchResults(max_results=5)
-            self.tools = [self.search_tool]
             
-        self.llm_with_tools = self.llm.bind_tools(self.tools)
-        self.memory = MemorySaver()
-        self.graph_builder = StateGraph(State)
+        self.temperature = temperature
+        self.llm, self.tools, self.llm_with_tools = get_bound_llm(temperature)
+        self.search_tool = self.tools[0] if self.tools else None
+        self.memory = get_checkpointer()
         self.setup_graph()
 
     def setup_graph(self):
+        # The graph only depends on the tools and on the LLM, which is fixed
+        # by temperature, so assistants for other model choices can share it
+        graphs = get_graph_cache()
+        key = (tuple(tool.name for tool in self.tools), self.temperature)
+        if key in graphs:
+            self.graph = graphs[key]
+            return
+        
+        self.graph_builder = StateGraph(State)
         self.graph_builder.add_node("chatbot", self.chatbot)
         
         if self.tools:
-            tool_node = ToolNode(tools=self.tools)
+            # Imported here so the prebuilt module only loads when search is enabled
+            from langgraph.prebuilt import ToolNode, tools_condition
+            
+            # Multiple tool calls in one reply run concurrently on the async graph
+            tool_node = ToolNode(tools=list(self.tools), handle_tool_errors=True)
             self.graph_builder.add_node("tools", tool_node)
             self.graph_builder.add_conditional_edges(
                 "chatbot",
@@ -90,58 +298,247 @@ class AIAssistant:
             
         self.graph_builder.add_edge(START, "chatbot")
         self.graph = self.graph_builder.compile(checkpointer=self.memory)
+        graphs[key] = self.graph
 
-    def chatbot(self, state: State):
+    async def summarize(self, summary: str, messages: List[Any]) -> str:
+        """Fold older messages into the running conversation summary"""
+        transcript = "\n".join(
+            f"{message.type}: {message.content}" for message in messages if message.content
+        )
+        prompt = (
+            "Update the summary of this conversation in under 200 tokens, "
+            "keeping facts, names and open questions.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        # Tagged so its tokens are kept out of the streamed reply
+        response = await self.llm.ainvoke(
+            [HumanMessage(content=prompt)],
+            config={"tags": ["internal"]}
+        )
+        return response.content
+
+    def needs_tools(self, text: str) -> bool:
+        """
+        Cheaply decide whether a user turn should go to the tool-bound LLM.
+        Only obvious small talk and arithmetic skip the tools; anything else
+        goes to the bound model, which decides itself whether to search.
+        """
+        if not self.tools:
+            return False
+        
+        text = text.strip()
+        return not (len(text) < 25 and (SMALL_TALK_PATTERN.match(text) or ARITHMETIC_PATTERN.fullmatch(text)))
+
+    async def chatbot(self, state: State):
         """Core chatbot logic with tool integration"""
         messages = state["messages"]
+        summary = state.get("summary", "")
+        summarized = state.get("summarized", 0)
+        update = {}
         try:
-            message = self.llm_with_tools.invoke(messages)
-            if hasattr(message, 'tool_calls'):
-                assert len(message.tool_calls) <= 1
-            return {"messages": [message]}
+            # Summarize once a full window of messages has scrolled out of view
+            boundary = len(messages) - HISTORY_WINDOW
+            if boundary - summarized >= HISTORY_WINDOW:
+                # Never split a tool call from its results
+                while boundary < len(messages) and isinstance(messages[boundary], ToolMessage):
+                    boundary += 1
+                summary = await self.summarize(summary, messages[summarized:boundary])
+                summarized = boundary
+                update = {"summary": summary, "summarized": summarized}
+
+            recent = messages[summarized:]
+            if summary:
+                recent = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + recent
+
+            # Tool results always go back to the tool-bound LLM
+            llm = self.llm_with_tools
+            if isinstance(messages[-1], HumanMessage) and not self.needs_tools(messages[-1].content):
+                llm = self.llm
+            
+            message = await llm.ainvoke(recent)
+            return {"messages": [message], **update}
         except Exception as e:
+            # Runs on the background loop, so report through the reply rather than st.error
             error_msg = f"Error: {str(e)}"
-            st.error(error_msg)
-            return {"messages": [AIMessage(content=error_msg)]}
-    
-    def run_conversation(self, user_input: str, thread_id: str):
-        """Execute conversation flow"""
+            return {"messages": [AIMessage(content=error_msg)], **update}
+
+    def stream_tokens(self, user_input: str, thread_id: str):
+        """Yield reply tokens from the chatbot node as they are generated"""
         config = {"configurable": {"thread_id": thread_id}}
+        tokens = queue.Queue()
+        done = object()
         
-        try:
-            events = self.graph.stream(
-                {"messages": [HumanMessage(content=user_input)]},
-                config,
-                stream_mode="values"
-            )
-            
-            final_response = None
-            for event in events:
-                if "messages" in event:
-                    final_response = event["messages"][-1]
-            
-            return final_response
-        except Exception as e:
-            error_msg = f"Conversation error: {str(e)}"
-            st.error(error_msg)
-            return AIMessage(content=error_msg)
+        async def produce():
+            search_result_count.set(2 if len(user_input.strip()) <= 40 else 5)
+            try:
+                async for event in self.graph.astream_events(
+                    {"messages": [HumanMessage(content=user_input)]},
+                    config,
+                    version="v2",
+                    durability="exit"
+                ):
+                    if event["event"] != "on_chat_model_stream" or "internal" in event.get("tags", []):
+                        continue
+                    if event.get("metadata", {}).get("langgraph_node") != "chatbot":
+                        continue
+                    content = event["data"]["chunk"].content
+                    if content:
+                        tokens.put(content)
+            finally:
+                tokens.put(done)
+        
+        future = asyncio.run_coroutine_threadsafe(produce(), get_background_loop())
+        while (token := tokens.get()) is not done:
+            yield token
+        # Surface any exception raised by the graph
+        future.result()
+    
+    def last_message(self, thread_id: str):
+        """Return the final message checkpointed for a thread"""
+        config = {"configurable": {"thread_id": thread_id}}
+        snapshot = run_async(self.graph.aget_state(config))
+        messages = snapshot.values.get("messages", [])
+        return messages[-1] if messages else None
+
+@st.cache_resource(show_spinner=False)
+def get_assistant(temperature: float, model: str):
+    """Build the assistant once per (temperature, model) and reuse it across reruns"""
+    return AIAssistant(temperature=temperature)
 
 def init_session_state():
     """Initialize all session state variables"""
     if "browser_client" not in st.session_state:
         st.session_state.browser_client = None
-    if "awaiting_input" not in st.session_state:
-        st.session_state.awaiting_input = False
-    if "pending_question" not in st.session_state:
-        st.session_state.pending_question = None
-    if "browser_response" not in st.session_state:
-        st.session_state.browser_response = None
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    if "browser_job" not in st.session_state:
+        st.session_state.browser_job = None
     if "browser_initialized" not in st.session_state:
         st.session_state.browser_initialized = False
     if "thread_id" not in st.session_state:
-        st.session_state.thread_id = str(uuid.uuid4())
+        st.session_state.thread_id = secrets.token_hex(8)
+
+def get_browser_client():
+    """Create a browser automation client, importing its dependencies on first use"""
+    from browser_client import BrowserAutomationClient
+    return BrowserAutomationClient()
+
+@st.fragment
+def chat_panel(assistant):
+    """Render the chat and handle input; reruns on its own without redrawing the sidebar"""
+    history = StreamlitChatMessageHistory(key="chat_history")
+    
+    chat_container = st.container()
+    
+    with chat_container:
+        for message in history.messages:
+            if isinstance(message, HumanMessage):
+                with st.chat_message("human", avatar="👤"):
+                    st.markdown(message.content)
+            elif isinstance(message, AIMessage):
+                with st.chat_message("assistant", avatar="🤖"):
+                    st.markdown(message.content)
+
+    # A browser task is in flight: wait until it finishes or needs information
+    job = st.session_state.browser_job
+    if job:
+        if job.question is None and not job.done():
+            with st.spinner("Processing browser automation..."):
+                job.wait()
+        
+        if job.done():
+            try:
+                result = job.result()
+                
+                # Check for errors
+                if "error" in result:
+                    history.add_message(
+                        AIMessage(content=f"⚠️ Browser automation error: {result['error']}")
+                    )
+                else:
+                    # Format the successful result
+                    response_text = f"Browser automation completed successfully.\n\n{result.get('result', 'Task completed')}"
+                    history.add_message(AIMessage(content=response_text))
+            
+            except Exception as e:
+                error_msg = f"Browser automation error: {str(e)}"
+                st.error(error_msg)
+                history.add_message(
+                    AIMessage(content=f"⚠️ {error_msg}")
+                )
+            
+            st.session_state.browser_job = None
+            
+            # Show the result inline instead of rerunning the fragment
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(history.messages[-1].content)
+        
+        else:
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(f"**Browser requires information:** {job.question}")
+            
+            browser_input = st.text_input("Your response:", key="browser_input")
+            
+            if st.button("Submit Response"):
+                # The paused task picks the answer up and sends it to the service
+                job.answer(browser_input)
+                st.rerun(scope="fragment")
+    
+    # Regular chat input
+    user_input = st.chat_input("Ask me anything...")
+    
+    if user_input:
+        # Add user message to chat history
+        history.add_message(HumanMessage(content=user_input))
+        
+        # Browser automation mode
+        if st.session_state.mode_toggle:
+            # Check if browser is initialized
+            if not st.session_state.browser_initialized:
+                reply = AIMessage(content="⚠️ Browser not initialized. Please initialize the browser first.")
+            elif st.session_state.browser_job:
+                reply = AIMessage(content="⚠️ A browser task is already running. Please wait for it to finish.")
+            else:
+                if not st.session_state.browser_client:
+                    st.session_state.browser_client = get_browser_client()
+                
+                # Start the task in the background; it pauses in place for any questions
+                st.session_state.browser_job = BrowserTaskRunner(
+                    get_background_loop(),
+                    st.session_state.browser_client,
+                    user_input
+                )
+                # Rerun so the fragment picks the job up and waits on it
+                st.rerun(scope="fragment")
+            
+            history.add_message(reply)
+            with st.chat_message("human", avatar="👤"):
+                st.markdown(user_input)
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(reply.content)
+        
+        # Conversational AI mode
+        else:
+            with st.chat_message("human", avatar="👤"):
+                st.markdown(user_input)
+            
+            with st.chat_message("assistant", avatar="🤖"):
+                try:
+                    # Show tokens as they arrive instead of waiting for the whole run
+                    st.write_stream(assistant.stream_tokens(
+                        user_input, 
+                        st.session_state.thread_id
+                    ))
+                    
+                    # The checkpoint holds the full reply, including any error message
+                    response = assistant.last_message(st.session_state.thread_id)
+                    if response:
+                        history.add_message(response)
+                    
+                except Exception as e:
+                    error_msg = f"An error occurred: {str(e)}"
+                    st.error(error_msg)
+                    history.add_message(
+                        AIMessage(content=f"⚠️ {error_msg}")
+                    )
 
 def main():
     st.set_page_config(
@@ -157,6 +554,10 @@ def main():
         st.title("🧠 AI Assistant Controls")
         
         if st.button("🔄 Reset Conversation", use_container_width=True):
+            # Unblock a task waiting on a question so its worker thread is freed
+            if st.session_state.get("browser_job"):
+                st.session_state.browser_job.cancel()
+            
             # Properly close browser if it's open
             if st.session_state.browser_client:
                 with st.spinner("Closing browser..."):
@@ -201,7 +602,7 @@ def main():
             
             # Initialize browser client if not already done
             if not st.session_state.browser_client:
-                st.session_state.browser_client = BrowserAutomationClient()
+                st.session_state.browser_client = get_browser_client()
                 
             # Display browser initialization button
             browser_service_url = st.text_input("Browser Service URL", "http://localhost:8000")
@@ -269,123 +670,10 @@ def main():
     else:
         st.caption("Intelligent Conversational AI")
 
-    # Initialize conversational assistant
-    assistant = AIAssistant(temperature=temperature/10)
-    
-    chat_container = st.container()
-    
-    with chat_container:
-        for message in st.session_state.chat_history:
-            if isinstance(message, HumanMessage):
-                with st.chat_message("human", avatar="👤"):
-                    st.markdown(message.content)
-            elif isinstance(message, AIMessage):
-                with st.chat_message("assistant", avatar="🤖"):
-                    st.markdown(message.content)
-
-    # If we're waiting for a response to a browser question
-    if st.session_state.awaiting_input and st.session_state.pending_question:
-        with st.chat_message("assistant", avatar="🤖"):
-            st.markdown(f"**Browser requires information:** {st.session_state.pending_question}")
-        
-        browser_input = st.text_input("Your response:", key="browser_input")
-        
-        if st.button("Submit Response"):
-            # Store response in a place our callback can access
-            st.session_state.browser_response = browser_input
-            st.session_state.awaiting_input = False
-            st.session_state.pending_question = None
-            
-            # Provide the input to the browser service
-            if st.session_state.browser_client:
-                success = st.session_state.browser_client.provide_input(browser_input)
-                if not success:
-                    st.error("Failed to send input to browser service")
-            
-            st.rerun()
-    
-    # Regular chat input
-    user_input = st.chat_input("Ask me anything...")
+    # Reuse the cached conversational assistant; thread_id keeps conversations apart
+    assistant = get_assistant(temperature/10, model_choice)
     
-    if user_input:
-        # Add user message to chat history
-        st.session_state.chat_history.append(HumanMessage(content=user_input))
-        
-        # Browser automation mode
-        if st.session_state.mode_toggle:
-            # Check if browser is initialized
-            if not st.session_state.browser_initialized:
-                st.session_state.chat_history.append(
-                    AIMessage(content="⚠️ Browser not initialized. Please initialize the browser first.")
-                )
-                st.rerun()
-                
-            with st.spinner("Processing browser automation..."):
-                if not st.session_state.browser_client:
-                    st.session_state.browser_client = BrowserAutomationClient()
-                
-                # Define the callback for handling user input requests during browser automation
-                def input_callback(question):
-                    # Set the state to indicate we're waiting for input
-                    st.session_state.awaiting_input = True
-                    st.session_state.pending_question = question
-                    st.session_state.browser_response = None
-                    
-                    # This will cause a rerun and pause execution here
-                    st.rerun()
-                    
-                    # When we return here after the user provides input, we should have the response
-                    response = st.session_state.get("browser_response", "No response provided")
-                    return response
-                
-                try:
-                    # Run the browser task
-                    result = st.session_state.browser_client.run_task(
-                        user_input, 
-                        input_callback=input_callback
-                    )
-                    
-                    # Check for errors
-                    if "error" in result:
-                        st.session_state.chat_history.append(
-                            AIMessage(content=f"⚠️ Browser automation error: {result['error']}")
-                        )
-                    else:
-                        # Format the successful result
-                        response_text = f"Browser automation completed successfully.\n\n{result.get('result', 'Task completed')}"
-                        st.session_state.chat_history.append(
-                    AIMessage(content=response_text)
-                    )
-                
-                except Exception as e:
-                    error_msg = f"Browser automation error: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.chat_history.append(
-                        AIMessage(content=f"⚠️ {error_msg}")
-                    )
-                
-                st.rerun()
-        
-        # Conversational AI mode
-        else:
-            with st.spinner("Analyzing your query..."):
-                try:
-                    response = assistant.run_conversation(
-                        user_input, 
-                        st.session_state.thread_id
-                    )
-                    
-                    if response:
-                        st.session_state.chat_history.append(response)
-                    
-                except Exception as e:
-                    error_msg = f"An error occurred: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.chat_history.append(
-                        AIMessage(content=f"⚠️ {error_msg}")
-                    )
-                
-                st.rerun()
+    chat_panel(assistant)
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,84 @@
 # browser_client.py
+import socket
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 import time
+import random
 import logging
-import json
-import websocket
+import orjson
+import asyncio
+import websockets
 import threading
-import queue
-import backoff
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit, urlunsplit
 from typing import Optional, Dict, Any, Callable, Union
 
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets keep urllib3's TCP_NODELAY and add SO_KEEPALIVE."""
+    
+    socket_options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+# (connect, read) timeouts; connecting to a local service should never take long
+DEFAULT_TIMEOUT = (3.05, 27)
+INIT_TIMEOUT = (5, 55)  # Starting Chrome makes /initialize slow to answer
+
+# One event loop thread carries the WebSocket reader of every client in the process
+_ws_loop = None
+_ws_loop_lock = threading.Lock()
+
+def _get_ws_loop():
+    global _ws_loop
+    with _ws_loop_lock:
+        if _ws_loop is None:
+            _ws_loop = asyncio.new_event_loop()
+            threading.Thread(target=_ws_loop.run_forever, name="browser-client-ws", daemon=True).start()
+    return _ws_loop
+
+def submit(coro):
+    """Schedule a coroutine on the shared WebSocket loop and return its concurrent future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_ws_loop())
+
+def _format_goto(action_type, details):
+    if 'url' in details:
+        return f"Navigated to {details['url']}"
+    return None
+
+def _format_element_action(action_type, details):
+    element = details.get('element')
+    element_desc = ""
+    if element:
+        if 'text' in element:
+            element_desc = f" on '{element['text']}'"
+        elif 'selector' in element:
+            element_desc = f" on {element['selector']}"
+    return f"Performed {action_type}{element_desc}"
+
+# Binary fields _clean_result replaces with a placeholder
+_LARGE = frozenset(("screenshot", "html", "full_html"))
+
+# Element actions reported as "Performed <type> on <element>"
+_RECOGNIZED = frozenset(("click", "type", "submit", "select"))
+
+# Step summary formatters for the action types _clean_result reports
+_ACTION_FORMATTERS = {
+    "go_to_url": _format_goto,
+    **dict.fromkeys(_RECOGNIZED, _format_element_action),
+}
+
+# Status keys the client reads; the service leaves everything else out,
+# including screenshots and page HTML inside last_result
+STATUS_FIELDS = "is_running,needs_input,pending_question,last_result,last_error,state_version"
+
+
 class BrowserAutomationClient:
     """
     Enhanced client for the Browser Automation Microservice with:
@@ -27,19 +97,55 @@ class BrowserAutomationClient:
             log_level: Logging level (default: INFO)
         """
         self.base_url = base_url
-        self.ws_base_url = base_url.replace("http://", "ws://").replace("https://", "wss://")
+        parts = urlsplit(base_url)
+        self.ws_base_url = urlunsplit(("wss" if parts.scheme == "https" else "ws", parts.netloc, parts.path, "", ""))
         self.session_id = None
-        self.polling_interval = 1  # seconds
+        self.polling_interval = 0.25  # seconds, delay after a status change
+        self.max_polling_interval = 8  # seconds, backoff cap while nothing changes
+        self.task_timeout = 600  # seconds
+        self.long_poll_wait = 25  # seconds the service may hold a status request
+        self.last_status = None
+        self.last_status_etag = None
         self.websocket = None
-        self.ws_connected = False
-        self.ws_message_queue = queue.Queue()
-        self.ws_thread = None
+        self.ws_connected = threading.Event()
+        self.ws_connect_timeout = 5  # seconds
+        self.ws_future = None
+        
+        # Task state written straight from WebSocket callbacks; _ws_update wakes the monitor
+        self._ws_update = threading.Event()
+        self._task_active = False
+        self._task_done = threading.Event()
+        self._task_result = None
+        self._input_needed = threading.Event()
+        self._pending_question = None
+        # Status frames at or below this state_version predate the task; None until
+        # /run_task answers, with the newest frame meanwhile parked in _early_status
+        self._task_min_version = -1
+        self._early_status = None
+        self._task_lock = threading.Lock()
+        
+        # Circuit breaker state: consecutive failures and when calls may resume
+        self.circuit_threshold = 5
+        self.circuit_max_cooloff = 60  # seconds
+        self._cb = {"fails": 0, "open_until": 0.0}
         
         # Setup logging
         self.logger = self._setup_logger(log_level)
         
-        # Requests session with retry capability
+        # Requests session with retry capability; pooled keep-alive connections
+        # to the service are reused across initialize/run/status/input/close calls.
+        # The service runs on uvicorn, which only speaks HTTP/1.1, so an HTTP/2
+        # client could not multiplex here; concurrent calls (e.g. the two halves of
+        # close_browser) instead get their own pooled socket, up to pool_maxsize.
         self.session = requests.Session()
+        adapter = _KeepAliveAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=self._build_retry()
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
         
         self.logger.info("Browser Automation Client initialized")
     
@@ -54,27 +160,49 @@ class BrowserAutomationClient:
         logger.setLevel(log_level)
         return logger
     
-    @backoff.on_exception(
-        backoff.expo,
-        (requests.exceptions.RequestException, ConnectionError),
-        max_tries=3,
-        factor=2
-    )
-    def _make_api_request(self, method, endpoint, json_data=None, timeout=30):
+    @staticmethod
+    def _build_retry():
+        """
+        Retry policy applied by urllib3 on the pooled connection.
+        
+        Connection failures are retried for every method since nothing
+        reached the service. Read errors and gateway errors are only
+        retried for GET: initialize and run_task are not idempotent.
+        """
+        return Retry(
+            total=3,
+            read=1,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False  # Hand the final response to raise_for_status
+        )
+    
+    def _make_api_request(self, method, endpoint, json_data=None, timeout=DEFAULT_TIMEOUT, url=None):
         """
-        Make API request with retry logic using backoff decorator.
+        Make API request; retries are handled by the session's HTTPAdapter.
         
         Args:
             method: HTTP method (GET, POST, etc.)
             endpoint: API endpoint
             json_data: JSON data to send
-            timeout: Request timeout in seconds
+            timeout: (connect, read) timeout in seconds
+            url: Precomputed full URL for endpoint, skips joining it to base_url
             
         Returns:
             Response object
         """
-        url = f"{self.base_url}/{endpoint}"
-        self.logger.debug(f"Making {method} request to {url}")
+        if url is None:
+            url = f"{self.base_url}/{endpoint}"
+        
+        # Fail fast while the service is known to be down
+        if time.monotonic() < self._cb["open_until"]:
+            raise requests.exceptions.ConnectionError(
+                f"Circuit open: browser service unavailable, skipping {method} {endpoint}"
+            )
+        
+        self.logger.debug("Making %s request to %s", method, url)
         
         try:
             if method.upper() == "GET":
@@ -84,28 +212,51 @@ class BrowserAutomationClient:
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
             
+            if response.status_code >= 500:
+                self._record_failure()
+            else:
+                self._cb["fails"] = 0  # The service answered; close the circuit
+            
             response.raise_for_status()  # Raise exception for 4XX/5XX responses
             return response
         except requests.exceptions.HTTPError as e:
             # For HTTP errors, try to extract error message from response
             try:
-                error_detail = e.response.json().get("detail", str(e))
-                self.logger.error(f"HTTP error: {error_detail}")
+                error_detail = orjson.loads(e.response.content).get("detail", str(e))
+                self.logger.error("HTTP error: %s", error_detail)
                 raise requests.exceptions.HTTPError(f"HTTP error: {error_detail}") from e
             except (ValueError, KeyError):
-                self.logger.error(f"HTTP error: {str(e)}")
+                self.logger.error("HTTP error: %s", e)
                 raise
         except requests.exceptions.ConnectionError as e:
-            self.logger.error(f"Connection error: {str(e)}")
+            self._record_failure()
+            self.logger.error("Connection error: %s", e)
             raise
         except requests.exceptions.Timeout as e:
-            self.logger.error(f"Request timeout: {str(e)}")
+            self._record_failure()
+            self.logger.error("Request timeout: %s", e)
             raise
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Request exception: {str(e)}")
+            self.logger.error("Request exception: %s", e)
             raise
     
-    def initialize_browser(self, chrome_path=None, headless=False, viewport_expansion=0):
+    def _record_failure(self):
+        """
+        Count a failed call and open the circuit after repeated failures.
+        
+        The cool-off doubles with each further failure up to circuit_max_cooloff;
+        the first call after it expires is a half-open probe that either closes
+        the circuit or reopens it for longer.
+        """
+        self._cb["fails"] += 1
+        fails = self._cb["fails"]
+        if fails >= self.circuit_threshold:
+            cooloff = min(self.circuit_max_cooloff, 2 ** fails)
+            self._cb["open_until"] = time.monotonic() + cooloff
+            self.logger.warning("Circuit open for %ss after %s consecutive failures", cooloff, fails)
+    
+    def initialize_browser(self, chrome_path=None, headless=False, viewport_expansion=0,
+                           task=None, max_steps=50):
         """
         Initialize a new browser session with better error handling and retry logic.
         
@@ -113,6 +264,9 @@ class BrowserAutomationClient:
             chrome_path: Path to Chrome executable
             headless: Whether to run Chrome in headless mode
             viewport_expansion: Amount to expand the viewport by
+            task: Optional first task, started in the same request; collect
+                its result with wait_for_task()
+            max_steps: Maximum number of steps for the first task
             
         Returns:
             bool: True if successful, False otherwise
@@ -121,32 +275,52 @@ class BrowserAutomationClient:
         
         try:
             request_data = {
-                "task": "",  # Empty task for initialization
+                "task": task or "",  # Empty task for initialization only
                 "chrome_path": chrome_path,
                 "headless": headless,
                 "viewport_expansion": viewport_expansion
             }
+            endpoint = "initialize"
+            if task:
+                request_data["max_steps"] = max_steps
+                endpoint = "initialize_and_run"
             
-            self.logger.debug(f"Initialization parameters: {request_data}")
+            self.logger.debug("Initialization parameters: %s", request_data)
             response = self._make_api_request(
                 "POST",
-                "initialize",
+                endpoint,
                 json_data=request_data,
-                timeout=60  # Longer timeout for initialization
+                timeout=INIT_TIMEOUT  # Longer timeout for initialization
             )
             
-            data = response.json()
-            self.session_id = data["session_id"]
-            self.logger.info(f"Browser initialized successfully with session ID: {self.session_id}")
+            data = orjson.loads(response.content)
+            self._set_session(data["session_id"])
+            self.logger.info("Browser initialized successfully with session ID: %s", self.session_id)
+            
+            # Track the first task; frames older than its start are ignored
+            if task:
+                self._reset_task_state(active=True, min_version=data.get("state_version", -1))
             
             # Start WebSocket connection after successful initialization
             self._setup_websocket_connection()
             
             return True
         except Exception as e:
-            self.logger.error(f"Failed to initialize browser: {str(e)}")
+            self.logger.error("Failed to initialize browser: %s", e)
             return False
     
+    def _set_session(self, session_id):
+        """Remember the session and precompute the paths and URLs every call reuses."""
+        self.session_id = session_id
+        fields = urlencode({"fields": STATUS_FIELDS})
+        self._status_path = f"status/{session_id}?{fields}"
+        self._input_path = f"provide_input/{session_id}"
+        self._close_path = f"close/{session_id}"
+        self._url_status = f"{self.base_url}/{self._status_path}"
+        self._url_input = f"{self.base_url}/{self._input_path}"
+        self._url_close = f"{self.base_url}/{self._close_path}"
+        self._ws_url = f"{self.ws_base_url}/ws/{session_id}?{fields}"
+    
     def _setup_websocket_connection(self):
         """Set up WebSocket connection for real-time updates."""
         if not self.session_id:
@@ -156,75 +330,125 @@ class BrowserAutomationClient:
         # Close existing connection if any
         self._close_websocket()
         
-        # Start WebSocket connection in a separate thread
-        self.ws_thread = threading.Thread(
-            target=self._websocket_thread,
-            daemon=True
-        )
-        self.ws_thread.start()
+        # Read the WebSocket on the shared loop instead of a thread per session
+        self.ws_future = submit(self._ws_reader(self._ws_url))
     
-    def _websocket_thread(self):
-        """WebSocket connection thread."""
-        ws_url = f"{self.ws_base_url}/ws/{self.session_id}"
-        self.logger.info(f"Connecting to WebSocket: {ws_url}")
+    async def _ws_reader(self, ws_url):
+        """Receive status frames until the connection closes."""
+        self.logger.info("Connecting to WebSocket: %s", ws_url)
+        ws = None
         
         try:
-            # Define WebSocket callbacks
-            def on_message(ws, message):
-                try:
-                    msg_data = json.loads(message)
-                    self.logger.debug(f"WebSocket message received: {msg_data}")
-                    self.ws_message_queue.put(msg_data)
-                except json.JSONDecodeError:
-                    self.logger.warning(f"Received invalid JSON: {message}")
-            
-            def on_error(ws, error):
-                self.logger.error(f"WebSocket error: {error}")
-            
-            def on_close(ws, close_status_code, close_msg):
-                self.logger.info(f"WebSocket closed: {close_status_code} - {close_msg}")
-                self.ws_connected = False
-            
-            def on_open(ws):
+            async with websockets.connect(ws_url) as ws:
+                self.websocket = ws
                 self.logger.info("WebSocket connection established")
-                self.ws_connected = True
-            
-            # Create WebSocket connection
-            self.websocket = websocket.WebSocketApp(
-                ws_url,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close,
-                on_open=on_open
-            )
-            
-            # Start WebSocket connection (this will block until closed)
-            self.websocket.run_forever()
+                self.ws_connected.set()
+                
+                async for message in ws:
+                    self._on_ws_message(message)
+            self.logger.info("WebSocket closed: %s - %s", ws.close_code, ws.close_reason)
+        except websockets.exceptions.ConnectionClosed as e:
+            self.logger.info("WebSocket closed: %s", e)
         except Exception as e:
-            self.logger.error(f"WebSocket thread error: {str(e)}")
-            self.ws_connected = False
+            self.logger.error("WebSocket error: %s", e)
+        finally:
+            if self.websocket is ws:
+                self.websocket = None
+            self.ws_connected.clear()
+            self._ws_update.set()  # Let a waiting monitor notice the lost connection
+    
+    def _on_ws_message(self, message):
+        try:
+            msg_data = orjson.loads(message)
+            # Frames can carry a whole task history; only repr them when DEBUG is on
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("WebSocket message received: %s", msg_data)
+            self._dispatch_ws_message(msg_data)
+        except orjson.JSONDecodeError:
+            self.logger.warning("Received invalid JSON: %s", message)
+    
+    def _dispatch_ws_message(self, message):
+        """Record what a WebSocket message means for the running task and wake the monitor."""
+        # Frames outside a task (e.g. the idle status sent on connect) are ignored,
+        # as is anything after the terminal frame the monitor is about to read.
+        # Only the latest state is kept, so a burst of updates costs one pass of
+        # the monitor and _clean_result runs once, on the final result.
+        if not self._task_active or self._task_done.is_set():
+            return
+        
+        msg_type = message.get("type")
+        if msg_type == "status_update":
+            with self._task_lock:
+                if self._task_min_version is None:
+                    # The task's start version isn't known yet; keep the frame for _arm_task
+                    self._early_status = message.get("status", {})
+                    return
+                if not self._apply_status(message.get("status", {})):
+                    return
+        elif msg_type == "task_complete":
+            self._task_result = {"is_running": False, "last_result": message.get("result", "Task completed")}
+            self._task_done.set()
+        elif msg_type == "task_error":
+            self._task_result = {"is_running": False, "last_error": message.get("error", "Unknown error")}
+            self._task_done.set()
+        else:
+            return
+        self._ws_update.set()
+    
+    def _apply_status(self, status):
+        """Record a status frame for the current task; False if it is stale or changes nothing."""
+        # The idle frame sent on connect, or one in flight from before the task
+        # started, has a version at or below the task's start and is dropped
+        version = status.get("state_version")
+        if version is not None and version <= self._task_min_version:
+            return False
+        if not status.get("is_running", True):
+            self._task_result = status
+            self._task_done.set()
+        elif status.get("needs_input"):
+            self._pending_question = status.get("pending_question", "Input needed:")
+            self._input_needed.set()
+        else:
+            return False
+        return True
+    
+    def _arm_task(self, min_version):
+        """Set the task's start version once known and replay a frame that arrived first."""
+        with self._task_lock:
+            self._task_min_version = min_version
+            status, self._early_status = self._early_status, None
+            if status is not None and self._apply_status(status):
+                self._ws_update.set()
     
     def _close_websocket(self):
         """Close the WebSocket connection."""
-        if self.websocket:
+        if self.ws_future:
             self.logger.info("Closing existing WebSocket connection")
-            self.websocket.close()
+            try:
+                if self.websocket is not None:
+                    submit(self.websocket.close()).result(timeout=2)
+                # Wait for the reader to finish
+                self.ws_future.result(timeout=2)
+            except Exception as e:
+                self.logger.warning("WebSocket did not close cleanly: %s", e)
+                self.ws_future.cancel()
+            self.ws_future = None
             self.websocket = None
-            self.ws_connected = False
-            
-            # Wait for thread to finish if it exists
-            if self.ws_thread and self.ws_thread.is_alive():
-                self.ws_thread.join(timeout=2)
-                self.ws_thread = None
+            self.ws_connected.clear()
     
-    def run_task(self, task, max_steps=50, input_callback: Optional[Callable[[str], str]] = None):
+    def run_task(self, task, max_steps=50, input_callback: Optional[Callable[[str], str]] = None,
+                 allow_polling_fallback=False):
         """
         Run a browser automation task and handle any user input requests.
         
+        Status updates arrive over the session's WebSocket. If it is not
+        connected, one reconnect is attempted before giving up.
+        
         Args:
             task: Task description
             max_steps: Maximum number of steps to run
             input_callback: Callback function for user input requests
+            allow_polling_fallback: Poll the status endpoint if the WebSocket is unavailable
             
         Returns:
             Dict with result or error
@@ -233,9 +457,20 @@ class BrowserAutomationClient:
             self.logger.error("No active browser session. Call initialize_browser() first.")
             return {"error": "No active browser session"}
             
-        self.logger.info(f"Running task: {task}")
+        self.logger.info("Running task: %s", task)
         
         try:
+            # Make sure the status channel is up before starting the task
+            use_websocket = self._ensure_websocket()
+            if not use_websocket and not allow_polling_fallback:
+                error_message = "WebSocket connection to the browser service is unavailable"
+                self.logger.error(error_message)
+                return {"error": error_message}
+            
+            # Reset task state so earlier status frames aren't mistaken for this task's result;
+            # frames are held until /run_task says which state_version the task started at
+            self._reset_task_state(active=use_websocket, min_version=None)
+            
             # Start the task
             response = self._make_api_request(
                 "POST",
@@ -247,105 +482,181 @@ class BrowserAutomationClient:
                 }
             )
             
-            task_info = response.json()
-            self.logger.debug(f"Task started: {task_info}")
+            task_info = orjson.loads(response.content)
+            self.logger.debug("Task started: %s", task_info)
+            self._arm_task(task_info.get("state_version", -1))
             
-            # Check if WebSocket is available for status updates
-            if self.ws_connected:
-                return self._monitor_task_websocket(input_callback)
-            else:
-                # Fall back to polling if WebSocket is not available
-                self.logger.info("WebSocket not connected, using polling for task status")
-                return self._monitor_task_polling(input_callback)
+            if use_websocket:
+                return self._monitor_task_websocket(input_callback, allow_polling_fallback)
+            
+            self.logger.info("WebSocket not connected, using polling for task status")
+            return self._monitor_task_polling(input_callback)
         except Exception as e:
+            self._task_active = False
             error_message = f"Error running task: {str(e)}"
             self.logger.error(error_message)
             return {"error": error_message}
     
-    def _monitor_task_websocket(self, input_callback):
+    def wait_for_task(self, input_callback: Optional[Callable[[str], str]] = None,
+                      allow_polling_fallback=False):
+        """
+        Wait for the task started by initialize_browser(task=...) to finish.
+        
+        Args:
+            input_callback: Callback function for user input requests
+            allow_polling_fallback: Poll the status endpoint if the WebSocket is unavailable
+            
+        Returns:
+            Dict with result or error
+        """
+        if not self.session_id:
+            self.logger.error("No active browser session. Call initialize_browser() first.")
+            return {"error": "No active browser session"}
+        
+        try:
+            if self._ensure_websocket():
+                return self._monitor_task_websocket(input_callback, allow_polling_fallback)
+            
+            self._task_active = False
+            if not allow_polling_fallback:
+                error_message = "WebSocket connection to the browser service is unavailable"
+                self.logger.error(error_message)
+                return {"error": error_message}
+            
+            self.logger.info("WebSocket not connected, using polling for task status")
+            return self._monitor_task_polling(input_callback)
+        except Exception as e:
+            self._task_active = False
+            error_message = f"Error waiting for task: {str(e)}"
+            self.logger.error(error_message)
+            return {"error": error_message}
+    
+    def _ensure_websocket(self):
+        """Wait for the WebSocket, reconnecting once if needed; True when connected."""
+        if not self.ws_connected.wait(timeout=self.ws_connect_timeout):
+            self.logger.warning("WebSocket not connected, reconnecting")
+            self._setup_websocket_connection()
+            self.ws_connected.wait(timeout=self.ws_connect_timeout)
+        return self.ws_connected.is_set()
+    
+    def _reset_task_state(self, active, min_version=-1):
+        """
+        Forget the previous task's WebSocket state; active enables dispatch for
+        the next one. min_version is the state_version its start returned, or
+        None to hold frames until _arm_task supplies it.
+        """
+        with self._task_lock:
+            self._task_done.clear()
+            self._input_needed.clear()
+            self._task_result = None
+            self._pending_question = None
+            self._task_min_version = min_version
+            self._early_status = None
+            self._task_active = active
+    
+    def _monitor_task_websocket(self, input_callback, allow_polling_fallback=False):
         """Monitor task progress using WebSocket connection."""
         self.logger.info("Monitoring task via WebSocket")
         
         try:
-            # Process messages from WebSocket until task completes
+            deadline = time.monotonic() + self.task_timeout
+            
+            # Handle whatever the WebSocket callbacks recorded until the task completes
             while True:
-                try:
-                    # Get message with timeout
-                    message = self.ws_message_queue.get(timeout=60)
-                    
-                    # Process message based on its type
-                    if message.get("type") == "status_update":
-                        status = message.get("status", {})
-                        
-                        # Check if task has completed
-                        if not status.get("is_running", True):
-                            if "last_error" in status and status["last_error"]:
-                                self.logger.error(f"Task error: {status['last_error']}")
-                                return {"error": status["last_error"]}
-                            else:
-                                result = self._clean_result(status.get("last_result", "Task completed"))
-                                self.logger.info("Task completed successfully")
-                                return {"result": result}
+                # Clear the wake-up before checking state so no update is missed
+                self._ws_update.clear()
+                
+                if self._task_done.is_set():
+                    result = self._task_outcome(self._task_result)
+                    self.logger.info("Task completed via WebSocket")
+                    return result
+                
+                if self._input_needed.is_set():
+                    self._input_needed.clear()
+                    question = self._pending_question
+                    if input_callback:
+                        self.logger.info("User input requested: %s", question)
                         
-                        # Check if input is needed
-                        if status.get("needs_input") and input_callback:
-                            question = status.get("pending_question", "Input needed:")
-                            self.logger.info(f"User input requested: {question}")
-                            
-                            user_answer = input_callback(question)
-                            self.logger.debug(f"User provided input: {user_answer}")
-                            
-                            # Provide the input back to the service
-                            self.provide_input(user_answer)
-                    
-                    elif message.get("type") == "task_complete":
-                        result = self._clean_result(message.get("result", "Task completed"))
-                        self.logger.info("Task completed (WebSocket notification)")
-                        return {"result": result}
-                    
-                    elif message.get("type") == "task_error":
-                        error_msg = message.get("error", "Unknown error")
-                        self.logger.error(f"Task error (WebSocket): {error_msg}")
-                        return {"error": error_msg}
+                        user_answer = input_callback(question)
+                        self.logger.debug("User provided input: %s", user_answer)
                         
-                except queue.Empty:
-                    # If no messages for 60 seconds, check status via API
-                    self.logger.warning("No WebSocket messages received for 60 seconds, checking status via API")
+                        # Provide the input back to the service
+                        self.provide_input(user_answer)
+                    continue
+                
+                if not self.ws_connected.is_set():
+                    # The connection dropped mid-task; check status once via API
+                    self.logger.warning("WebSocket disconnected during task, checking status via API")
                     status = self.get_status()
-                    
-                    if not status.get("is_running", False):
-                        if "last_error" in status and status["last_error"]:
-                            return {"error": status["last_error"]}
-                        else:
-                            result = self._clean_result(status.get("last_result", "Task completed"))
-                            return {"result": result}
+                    if "error" not in status and not status.get("is_running", False):
+                        return self._task_outcome(status)
+                    if allow_polling_fallback:
+                        return self._monitor_task_polling(input_callback)
+                    return {"error": "WebSocket connection lost while the task was running"}
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error_msg = "Task monitoring timed out after 10 minutes"
+                    self.logger.error(error_msg)
+                    return {"error": error_msg}
+                self._ws_update.wait(timeout=remaining)
         except Exception as e:
-            self.logger.error(f"Error monitoring task via WebSocket: {str(e)}")
-            # Fall back to polling on WebSocket failure
-            return self._monitor_task_polling(input_callback)
+            self.logger.error("Error monitoring task via WebSocket: %s", e)
+            if allow_polling_fallback:
+                # Fall back to polling on WebSocket failure
+                return self._monitor_task_polling(input_callback)
+            return {"error": f"Error monitoring task via WebSocket: {str(e)}"}
+        finally:
+            self._task_active = False
+    
+    def _task_outcome(self, status):
+        """Turn a finished task's status into the result or error run_task returns."""
+        if status.get("last_error"):
+            self.logger.error("Task error: %s", status['last_error'])
+            return {"error": status["last_error"]}
+        return {"result": self._clean_result(status.get("last_result", "Task completed"))}
     
     def _monitor_task_polling(self, input_callback):
         """Monitor task progress using polling."""
         self.logger.info("Monitoring task via polling")
         
         try:
-            poll_count = 0
-            max_polls = 600  # 10 minutes with 1-second interval
+            # Use a wall-clock deadline so backoff doesn't shorten the timeout
+            deadline = time.monotonic() + self.task_timeout
+            delay = self.polling_interval
+            last_state = None
+            next_status = None  # Status already fetched together with an input answer
             
-            # Poll for status and handle input requests
-            while poll_count < max_polls:
-                time.sleep(self.polling_interval)
-                poll_count += 1
-                
-                status = self.get_status()
+            # Long-poll for status and handle input requests
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                status = next_status or self.get_status(wait=self.long_poll_wait, etag=self.last_status_etag)
+                next_status = None
                 if isinstance(status, dict) and "error" in status:
-                    self.logger.error(f"Error getting status: {status['error']}")
+                    self.logger.error("Error getting status: %s", status['error'])
+                    # Sleep with jitter so many clients don't retry in lockstep
+                    time.sleep(delay * (0.5 + random.random() * 0.5))
+                    delay = min(self.max_polling_interval, delay * 2)
                     continue
                 
+                state = (
+                    status.get("is_running"),
+                    status.get("needs_input"),
+                    status.get("last_result") is not None
+                )
+                if state != last_state:
+                    delay = self.polling_interval
+                elif time.monotonic() - started < 1:
+                    # The service answered without holding the request (first
+                    # poll or no long-poll support), so back off before asking again
+                    time.sleep(delay * (0.5 + random.random() * 0.5))
+                    delay = min(self.max_polling_interval, delay * 2)
+                last_state = state
+                
                 # If task is not running and there's a result or error, we're done
                 if not status.get("is_running"):
                     if "last_error" in status and status["last_error"]:
-                        self.logger.error(f"Task failed: {status['last_error']}")
+                        self.logger.error("Task failed: %s", status['last_error'])
                         return {"error": status["last_error"]}
                     else:
                         # Clean up the result before returning
@@ -358,13 +669,13 @@ class BrowserAutomationClient:
                 # If input is needed and we have a callback
                 if status.get("needs_input") and input_callback:
                     question = status.get("pending_question", "Input needed:")
-                    self.logger.info(f"User input requested: {question}")
+                    self.logger.info("User input requested: %s", question)
                     
                     user_answer = input_callback(question)
-                    self.logger.debug(f"User provided input: {user_answer}")
+                    self.logger.debug("User provided input: %s", user_answer)
                     
-                    # Provide the input back to the service
-                    self.provide_input(user_answer)
+                    # Provide the input back to the service and pick up the status it leads to
+                    next_status = self._provide_input_and_get_status(user_answer)
             
             # If we reach this point, we've exceeded the maximum polling attempts
             error_msg = "Task monitoring timed out after 10 minutes"
@@ -391,58 +702,59 @@ class BrowserAutomationClient:
                 if 'history' in result:
                     # Format the history in a more readable way
                     summary = []
+                    append = summary.append
+                    join = ", ".join
+                    formatters = _ACTION_FORMATTERS
                     for step in result['history']:
-                        # Extract actions performed
+                        # Extract actions performed; unrecognized action types are skipped
                         actions = []
-                        if 'model_output' in step and 'action' in step['model_output']:
-                            for action in step['model_output']['action']:
-                                for action_type, details in action.items():
-                                    if action_type == 'go_to_url' and 'url' in details:
-                                        actions.append(f"Navigated to {details['url']}")
-                                    elif action_type in ['click', 'type', 'submit', 'select']:
-                                        element_desc = ""
-                                        if 'element' in details:
-                                            if 'text' in details['element']:
-                                                element_desc = f" on '{details['element']['text']}'"
-                                            elif 'selector' in details['element']:
-                                                element_desc = f" on {details['element']['selector']}"
-                                        actions.append(f"Performed {action_type}{element_desc}")
+                        model_output = step.get('model_output') or {}
+                        for action in model_output.get('action') or ():
+                            if not action:
+                                continue
+                            # Each serialized action is a single {action_type: params} entry
+                            action_type, details = next(iter(action.items()))
+                            fmt = formatters.get(action_type)
+                            if fmt is not None:
+                                text = fmt(action_type, details)
+                                if text:
+                                    actions.append(text)
                         
                         # Extract result information
-                        results = []
-                        if 'result' in step:
-                            for res in step['result']:
-                                if 'extracted_content' in res:
-                                    results.append(res['extracted_content'])
+                        results = [res['extracted_content'] for res in step.get('result') or ()
+                                   if 'extracted_content' in res]
                         
-                        if actions or results:
-                            step_summary = "• " + ", ".join(actions) if actions else "• Action performed"
-                            if results:
-                                step_summary += f" → {' '.join(results)}"
-                            summary.append(step_summary)
+                        if not actions and not results:
+                            continue
+                        step_summary = "• " + join(actions) if actions else "• Action performed"
+                        append(f"{step_summary} → {' '.join(results)}" if results else step_summary)
                     
-                    return "Task completed with the following steps:\n" + "\n".join(summary)
+                    if result.get('status') == 'partial':
+                        heading = "Task stopped at the time limit after the following steps:\n"
+                    else:
+                        heading = "Task completed with the following steps:\n"
+                    return heading + "\n".join(summary)
                 
                 # For simpler result formats, convert to string without large data
-                clean_dict = {}
-                for key, value in result.items():
-                    # Skip large binary data fields
-                    if key in ['screenshot', 'html', 'full_html']:
-                        clean_dict[key] = "[large data omitted]"
-                    else:
-                        clean_dict[key] = value
-                return json.dumps(clean_dict, indent=2)
+                if not _LARGE.isdisjoint(result):
+                    result = {key: ("[large data omitted]" if key in _LARGE else value)
+                              for key, value in result.items()}
+                return orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
             
             # If it's a string, just return it
             return str(result)
         except Exception as e:
-            self.logger.error(f"Error cleaning result: {str(e)}")
+            self.logger.error("Error cleaning result: %s", e)
             return str(result)
     
-    def get_status(self):
+    def get_status(self, wait=0, etag=None):
         """
         Get the current status of the browser session.
         
+        Args:
+            wait: Seconds the service may hold the request waiting for a change
+            etag: ETag of the last status seen; only used together with wait
+            
         Returns:
             Dict containing session status
         """
@@ -451,9 +763,24 @@ class BrowserAutomationClient:
             return {"error": "No active browser session"}
             
         try:
-            self.logger.debug(f"Getting status for session {self.session_id}")
-            response = self._make_api_request("GET", f"status/{self.session_id}")
-            return response.json()
+            self.logger.debug("Getting status for session %s", self.session_id)
+            url = self._url_status
+            if wait and etag:
+                url = f"{url}&{urlencode({'wait': wait, 'etag': etag})}"
+            response = self._make_api_request(
+                "GET",
+                self._status_path,
+                timeout=(DEFAULT_TIMEOUT[0], wait + DEFAULT_TIMEOUT[1]),
+                url=url
+            )
+            
+            # 304 means nothing changed while the service held the request
+            if response.status_code == 304 and self.last_status is not None:
+                return self.last_status
+            
+            self.last_status = orjson.loads(response.content)
+            self.last_status_etag = response.headers.get("ETag")
+            return self.last_status
         except Exception as e:
             error_msg = f"Error getting status: {str(e)}"
             self.logger.error(error_msg)
@@ -474,19 +801,63 @@ class BrowserAutomationClient:
             return False
             
         try:
-            self.logger.info(f"Providing user input for session {self.session_id}")
+            self.logger.info("Providing user input for session %s", self.session_id)
             response = self._make_api_request(
                 "POST",
-                f"provide_input/{self.session_id}",
-                json_data={"answer": answer}
+                self._input_path,
+                json_data={"answer": answer},
+                url=self._url_input
             )
             
             self.logger.debug("Input provided successfully")
             return True
         except Exception as e:
-            self.logger.error(f"Error providing input: {str(e)}")
+            self.logger.error("Error providing input: %s", e)
             return False
     
+    def batch(self, calls):
+        """
+        Send several status/input calls to the service in one request.
+        
+        Args:
+            calls: List of (method, endpoint, json_data) tuples
+            
+        Returns:
+            List of {"status_code", "body"} or {"status_code", "detail"} dicts in call order
+        """
+        response = self._make_api_request(
+            "POST",
+            "batch",
+            json_data=[{"method": method, "path": endpoint, "body": body} for method, endpoint, body in calls]
+        )
+        return orjson.loads(response.content)
+    
+    def _provide_input_and_get_status(self, answer):
+        """
+        Provide user input and read the resulting status in one round trip.
+        
+        Returns:
+            The fresh status dict, or None if it has to be fetched separately
+        """
+        try:
+            self.logger.info("Providing user input for session %s", self.session_id)
+            provided, status = self.batch([
+                ("POST", self._input_path, {"answer": answer}),
+                ("GET", self._status_path, None)
+            ])
+        except Exception as e:
+            self.logger.warning("Batch call failed, providing input directly: %s", e)
+            self.provide_input(answer)
+            return None
+        
+        if provided["status_code"] != 200:
+            self.logger.error("Error providing input: %s", provided.get("detail"))
+        if status["status_code"] != 200:
+            return None
+        self.last_status = status["body"]
+        self.last_status_etag = status.get("etag")
+        return self.last_status
+    
     def close_browser(self):
         """
         Close the browser session.
@@ -499,21 +870,31 @@ class BrowserAutomationClient:
             return True
             
         try:
-            self.logger.info(f"Closing browser session {self.session_id}")
-            
-            # Close WebSocket connection first
-            self._close_websocket()
+            self.logger.info("Closing browser session %s", self.session_id)
             
-            # Close browser session
-            response = self._make_api_request("POST", f"close/{self.session_id}")
+            # Close the WebSocket and the browser session at the same time;
+            # shutdown(wait=False) keeps a stuck close from holding us here
+            executor = ThreadPoolExecutor(max_workers=2)
+            try:
+                ws_closed = executor.submit(self._close_websocket)
+                api_closed = executor.submit(self._make_api_request, "POST", self._close_path, url=self._url_close)
+                response = api_closed.result()
+                try:
+                    ws_closed.result(timeout=5)
+                except Exception as e:
+                    self.logger.warning("WebSocket close did not finish: %s", e)
+            finally:
+                executor.shutdown(wait=False)
             
             if response.status_code == 200:
                 self.logger.info("Browser session closed successfully")
                 self.session_id = None
+                # Release pooled connections; the pool reopens on next use
+                self.session.close()
                 return True
             else:
                 self.logger.error("Failed to close browser session")
                 return False
         except Exception as e:
-            self.logger.error(f"Error closing browser: {str(e)}")
+            self.logger.error("Error closing browser: %s", e)
             return False
\ No newline at end of file
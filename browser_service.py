@@ -2,13 +2,31 @@
 import asyncio
 import os
 import json
-import traceback
+import logging
+import logging.handlers
+import platform
+import queue
+import signal
+import socket
+import subprocess
+import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
 from typing import Dict, List, Any, Optional
-from fastapi import FastAPI, HTTPException, BackgroundTasks # type: ignore
+from urllib.parse import urlsplit, parse_qsl
+from fastapi import FastAPI, Header, HTTPException, Response, WebSocket, WebSocketDisconnect # type: ignore
+from fastapi.encoders import jsonable_encoder # type: ignore
+from fastapi.responses import ORJSONResponse # type: ignore
 from pydantic import BaseModel, SecretStr
+from cachetools import TTLCache
 
+import httpx
 from dotenv import load_dotenv
 import uvicorn # type: ignore
+import orjson # type: ignore
 
 # Browser automation imports
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -16,16 +34,22 @@ from langchain_openai import ChatOpenAI
 from browser_use import Agent, BrowserConfig, Controller, ActionResult
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContextConfig
+from playwright.async_api import async_playwright
 
-app = FastAPI(title="Browser Automation Service")
+app = FastAPI(title="Browser Automation Service", default_response_class=ORJSONResponse)
 
 # Load environment variables
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
-# Store active browser sessions
-active_sessions = {}
+# Store active browser sessions, least recently used first
+MAX_SESSIONS = 128
+active_sessions = OrderedDict()
+
+# Results larger than this are kept trimmed in memory, in full on disk
+MAX_RESULT_CHARS = 64_000
+RESULT_SNAPSHOT_DIR = os.getenv("RESULT_SNAPSHOT_DIR", "result_snapshots")
 
 class BrowserTask(BaseModel):
     task: str
@@ -34,6 +58,7 @@ class BrowserTask(BaseModel):
     headless: bool = False
     max_steps: int = 50
     viewport_expansion: int = 0
+    force_kill_all_chrome: bool = False
 
 class UserInputRequest(BaseModel):
     session_id: str
@@ -42,14 +67,378 @@ class UserInputRequest(BaseModel):
 class UserInputResponse(BaseModel):
     answer: str
 
-# Store pending user input requests
-pending_inputs = {}
+class BatchCall(BaseModel):
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+
+# Store pending user input requests; abandoned questions expire after an hour
+pending_inputs = TTLCache(maxsize=MAX_SESSIONS, ttl=3600)
+
+# How long ask_human keeps the agent waiting for an answer
+INPUT_TIMEOUT = 300
+
+# Guard the shared dicts; held only around dict access, never across browser or agent work
+_sessions_lock = asyncio.Lock()
+_pending_lock = asyncio.Lock()
+
+# Strong references to running background tasks so they aren't garbage collected mid-run
+_bg_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Start a tracked background task"""
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+    return task
+
+# Tasks wait in their session's FIFO (session["jobs"]); task_queue holds the ids of
+# sessions with work, each at most once, so a fixed set of workers takes one task per
+# session at a time and never blocks behind a busy session. Each task_id's progress
+# is kept in task_records, oldest dropped past MAX_TASK_RECORDS
+N_WORKERS = 4
+MAX_QUEUED_TASKS = 256
+queued_task_count = 0
+task_queue = asyncio.Queue()
+task_workers = []
+MAX_TASK_RECORDS = 1024
+task_records = OrderedDict()
+
+async def cancel_task(task: Optional[asyncio.Task]):
+    """Cancel a background task and wait for it to unwind"""
+    if task and not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+# Log records are queued and written by a listener thread, so the event loop never
+# blocks on a slow stdout pipe; see start_logging
+logger = logging.getLogger("browser_service")
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+# Warm Chrome pool: with CHROME_PATH set, CHROME_POOL_SIZE instances are started at
+# startup on consecutive debugging ports and lent out to sessions that ask for Chrome
+ChromeInstance = namedtuple("ChromeInstance", "process cdp_url user_data_dir")
+CHROME_PATH = os.getenv("CHROME_PATH")
+CHROME_POOL_SIZE = int(os.getenv("CHROME_POOL_SIZE", "2"))
+CHROME_POOL_BASE_PORT = 9222
+# Each uvicorn worker claims a slot at startup; slot n owns the debugging ports from
+# CHROME_POOL_BASE_PORT + n*10, the last of which is held as the slot's claim marker
+CHROME_PORTS_PER_WORKER = 10
+worker_slot = 0
+_slot_socket: Optional[socket.socket] = None
+CHROME_POOL_TIMEOUT = 30  # seconds to wait for a free instance
+CDP_READY_TIMEOUT = 15  # seconds a fresh Chrome gets to open its debugging endpoint
+chrome_pool: Optional[asyncio.Queue] = None
+# Keeps Chrome from opening a console window on Windows; 0 (no flags) elsewhere
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+# Process-wide, so resolved and created once at import rather than per /initialize
+SYSTEM_TYPE = platform.system()
+USER_DATA_DIR = os.path.join(os.path.expanduser("~"), ".chrome-automation-data")
+os.makedirs(USER_DATA_DIR, exist_ok=True)
+# Profile for the per-session Chrome of this worker; set when its slot is claimed
+worker_user_data_dir = USER_DATA_DIR
+
+# PIDs of Chrome processes launched per session on the pool-less path
+_our_chrome_pids = set()
+
+# Longest a /status request may be held waiting for a change
+MAX_STATUS_WAIT = 30
+
+def mark_changed(session_id: str):
+    """Bump a session's state version and wake any long-polling /status requests"""
+    session = active_sessions.get(session_id)
+    if session is not None:
+        bump_state(session)
+
+def bump_state(session: Dict[str, Any]):
+    """mark_changed for a session already in hand, including one just removed"""
+    session["state_version"] += 1
+    changed = session["changed"]
+    session["changed"] = asyncio.Event()
+    changed.set()
+
+# Step events buffered per /ws/status subscriber; the oldest are dropped for slow readers
+STEP_QUEUE_SIZE = 100
+
+def publish_event(session: Dict[str, Any], event: Optional[Dict[str, Any]]):
+    """Hand an event to every step stream of the session; None ends the streams"""
+    for events in session["step_subscribers"]:
+        if events.full():
+            events.get_nowait()
+        events.put_nowait(event)
+
+def step_event(task_id: Optional[str], state, model_output, step_number: int) -> Dict[str, Any]:
+    """Summarise one agent step for the step stream"""
+    current = getattr(model_output, "current_state", None)
+    actions = getattr(model_output, "action", None) or []
+    return jsonable_encoder({
+        "type": "step",
+        "task_id": task_id,
+        "step": step_number,
+        "url": getattr(state, "url", None),
+        "next_goal": getattr(current, "next_goal", None),
+        "actions": [action.model_dump(exclude_unset=True) for action in actions]
+    })
+
+async def update_session(session_id: str, **fields):
+    """Apply fields to a live session under the lock and wake any status waiters"""
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+        if session is None:
+            return
+        session.update(fields)
+        mark_changed(session_id)
+
+def claim_worker_slot() -> int:
+    """Claim the lowest free worker slot by binding its marker port for the process lifetime"""
+    global worker_slot, _slot_socket, worker_user_data_dir
+    for slot in range(64):
+        marker = CHROME_POOL_BASE_PORT + (slot + 1) * CHROME_PORTS_PER_WORKER - 1
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(("127.0.0.1", marker))
+        except OSError:
+            sock.close()
+            continue
+        worker_slot, _slot_socket = slot, sock
+        if slot:
+            worker_user_data_dir = f"{USER_DATA_DIR}-worker{slot}"
+            os.makedirs(worker_user_data_dir, exist_ok=True)
+        return slot
+    raise RuntimeError("No free worker slot for Chrome debugging ports")
+
+def worker_chrome_port(index: int = 0) -> int:
+    """Debugging port for this worker's index-th Chrome"""
+    return CHROME_POOL_BASE_PORT + worker_slot * CHROME_PORTS_PER_WORKER + index
+
+async def launch_chrome(chrome_path: str, port: int, user_data_dir: str):
+    """Start Chrome with remote debugging on port and return its asyncio process"""
+    chrome_args = [
+        chrome_path,
+        f"--remote-debugging-port={port}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        f"--user-data-dir={user_data_dir}",
+        "about:blank"
+    ]
+    
+    # Chrome's output is discarded since nothing reads it and a full pipe would stall it
+    return await asyncio.create_subprocess_exec(
+        *chrome_args, 
+        stdout=subprocess.DEVNULL, 
+        stderr=subprocess.DEVNULL,
+        creationflags=CREATE_NO_WINDOW
+    )
+
+def terminate_chrome(pid: int):
+    """
+    Stop a Chrome launched for a session unless it was already stopped. Also
+    runs as a finalizer, so it only signals the process and never blocks.
+    """
+    if pid not in _our_chrome_pids:
+        return  # Closed normally, or the pid is no longer ours
+    _our_chrome_pids.discard(pid)
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass  # Already gone
+
+async def wait_for_cdp(cdp_url: str, process, timeout: float = CDP_READY_TIMEOUT) -> bool:
+    """Probe /json/version with backoff until Chrome answers, exits or timeout passes"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.1
+    async with httpx.AsyncClient(timeout=0.5) as client:
+        while process.returncode is None:
+            try:
+                response = await client.get(f"{cdp_url}/json/version")
+                if response.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            if loop.time() + delay > deadline:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.6)
+    return False
+
+async def start_pooled_chrome(port: int, user_data_dir: str) -> ChromeInstance:
+    """Launch one pool instance and wait for it to come up"""
+    process = await launch_chrome(CHROME_PATH, port, user_data_dir)
+    cdp_url = f"http://localhost:{port}"
+    if not await wait_for_cdp(cdp_url, process):
+        if process.returncode is None:
+            process.kill()
+        raise RuntimeError(f"Chrome on port {port} did not become ready")
+    return ChromeInstance(process, cdp_url, user_data_dir)
+
+async def respawn_chrome(instance: ChromeInstance) -> ChromeInstance:
+    """Replace a dead or unusable pool instance on the same port and profile"""
+    if instance.process.returncode is None:
+        instance.process.kill()
+    port = urlsplit(instance.cdp_url).port
+    return await start_pooled_chrome(port, instance.user_data_dir)
+
+async def checkout_chrome() -> ChromeInstance:
+    """Take a warm Chrome from the pool, replacing it first if it has exited"""
+    instance = await asyncio.wait_for(chrome_pool.get(), timeout=CHROME_POOL_TIMEOUT)
+    if instance.process.returncode is not None:
+        logger.warning("Pooled Chrome on %s exited, restarting it", instance.cdp_url)
+        instance = await respawn_chrome(instance)
+    return instance
+
+async def reset_chrome(cdp_url: str):
+    """Clear cookies and close all but one blank tab so the next session starts clean"""
+    async with async_playwright() as playwright:
+        chrome = await playwright.chromium.connect_over_cdp(cdp_url)
+        try:
+            context = chrome.contexts[0]
+            await context.clear_cookies()
+            pages = context.pages
+            for page in pages[1:]:
+                await page.close()
+            if pages:
+                await pages[0].goto("about:blank")
+            else:
+                await context.new_page()
+        finally:
+            await chrome.close()  # Disconnects only; the pooled Chrome keeps running
+
+async def return_chrome(instance: ChromeInstance):
+    """Reset a session's Chrome and put it back in the pool"""
+    try:
+        await reset_chrome(instance.cdp_url)
+    except Exception as e:
+        logger.warning("Failed to reset pooled Chrome on %s, restarting it: %s", instance.cdp_url, e)
+        try:
+            instance = await respawn_chrome(instance)
+        except Exception as e:
+            logger.error("Failed to restart pooled Chrome: %s", e)
+            return
+    await chrome_pool.put(instance)
+
+def write_snapshot(path: str, encoded: Any):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(encoded, f)
+
+def encoded_size(value: Any) -> int:
+    return len(orjson.dumps(value))
+
+def trim_result(session_id: str, result: Any) -> Any:
+    """
+    Encode a task result and cut it down to MAX_RESULT_CHARS. Screenshots and
+    page HTML are dropped; if it is still too large, the full result goes to
+    a snapshot file and only as many of the last steps as fit are kept.
+    Runs in a worker thread, since it walks the whole history.
+    """
+    try:
+        encoded = jsonable_encoder(result)
+    except (TypeError, ValueError):
+        # Agent output the encoder can't walk is kept as text
+        encoded = str(result)
+    retained = omit_large_fields(encoded)
+    if encoded_size(retained) <= MAX_RESULT_CHARS:
+        return retained
+    
+    # Named by the server, never by the client-supplied session id
+    path = os.path.join(RESULT_SNAPSHOT_DIR, f"{uuid.uuid4().hex}.json")
+    write_snapshot(path, {"session_id": session_id, "result": encoded})
+    if isinstance(retained, dict) and isinstance(retained.get("history"), list):
+        history = retained["history"][-20:]
+        while history:
+            trimmed = {"history": history, "truncated": True, "snapshot": path}
+            if encoded_size(trimmed) <= MAX_RESULT_CHARS:
+                return trimmed
+            history = history[1:]
+    return {"result": str(retained)[:MAX_RESULT_CHARS], "truncated": True, "snapshot": path}
+
+async def retain_result(session_id: str, result: Any) -> Any:
+    """Return the form of a task result kept on the session; see trim_result"""
+    return await asyncio.to_thread(trim_result, session_id, result)
+
+def status_etag(session_id: str, session: Dict[str, Any], fields: Optional[str] = None) -> str:
+    """ETag of a session's status; each fields projection gets its own tag"""
+    projection = zlib.crc32(fields.encode()) if fields else 0
+    return f'"{session_id}-{session["state_version"]}-{projection:x}"'
+
+def expire_pending_inputs():
+    """
+    Drop questions past their TTL and bump their sessions' state versions, so
+    cached status bodies and ETags don't outlive them. Call with _pending_lock held.
+    """
+    for session_id, _ in pending_inputs.expire():
+        mark_changed(session_id)
+
+# Screenshot and page dumps that projected status responses leave out
+LARGE_FIELDS = frozenset(["screenshot", "html", "full_html"])
+
+def omit_large_fields(value: Any) -> Any:
+    """Recursively drop LARGE_FIELDS keys from an already-encoded value"""
+    if isinstance(value, dict):
+        return {key: omit_large_fields(item) for key, item in value.items() if key not in LARGE_FIELDS}
+    if isinstance(value, list):
+        return [omit_large_fields(item) for item in value]
+    return value
+
+def status_payload(session_id: str, session: Dict[str, Any], fields: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the status body shared by /status and the status WebSocket.
+    fields is a comma-separated projection; when given, only those keys are
+    returned and large blobs are stripped from last_result.
+    """
+    # Check if there's a pending input question
+    pending_question = pending_inputs.get(session_id)
+    
+    payload = {
+        "session_id": session_id,
+        "is_running": session["is_running"],
+        "pending_task": session["pending_task"],
+        "needs_input": pending_question is not None,
+        "pending_question": pending_question,
+        "last_result": session.get("last_result"),
+        "last_error": session.get("last_error"),
+        "state_version": session["state_version"]
+    }
+    if not fields:
+        return payload
+    
+    wanted = {name.strip() for name in fields.split(",")}
+    payload = {key: value for key, value in payload.items() if key in wanted}
+    if payload.get("last_result") is not None:
+        payload["last_result"] = omit_large_fields(jsonable_encoder(payload["last_result"]))
+    return payload
+
+# Distinct fields projections cached per state_version before the cache is reset
+MAX_CACHED_PROJECTIONS = 8
+
+def encoded_status(session_id: str, session: Dict[str, Any], fields: Optional[str] = None) -> bytes:
+    """
+    status_payload encoded with orjson. The bytes are cached on the session
+    until its state_version changes, so repeated polls skip the encoding.
+    Call with _pending_lock held.
+    """
+    expire_pending_inputs()
+    version = session["state_version"]
+    cached = session.get("status_body_cache")
+    if cached is None or cached[0] != version or len(cached[1]) >= MAX_CACHED_PROJECTIONS:
+        cached = (version, {})
+        session["status_body_cache"] = cached
+    body = cached[1].get(fields)
+    if body is None:
+        body = orjson.dumps(jsonable_encoder(status_payload(session_id, session, fields)))
+        cached[1][fields] = body
+    return body
 
 @app.post("/initialize")
 async def initialize_browser(config: BrowserTask):
     try:
         # Generate a session ID if none was provided
-        session_id = config.session_id or f"session_{len(active_sessions) + 1}"
+        session_id = config.session_id or f"session_{uuid.uuid4().hex}"
+        async with _sessions_lock:
+            if session_id in active_sessions:
+                raise HTTPException(status_code=409, detail="Session id already in use")
         
         # Check API keys
         if not GEMINI_API_KEY or not OPENROUTER_API_KEY:
@@ -64,176 +453,383 @@ async def initialize_browser(config: BrowserTask):
         )
         
         chrome_process = None
-        # Handle Chrome launch based on OS
-        import platform
-        system_type = platform.system()
-        
-        if config.chrome_path:
-            import subprocess
-            import time
-            
-            # Kill existing Chrome processes
+        chrome_instance = None
+        if config.chrome_path and chrome_pool is not None:
+            # Borrow a warm Chrome instead of killing and relaunching one
             try:
-                print("Killing existing Chrome processes...")
-                if system_type == "Windows":
-                    subprocess.run(["taskkill", "/F", "/IM", "chrome.exe"], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                elif system_type == "Linux":
-                    # For WSL or regular Linux
-                    if "/mnt/" in config.chrome_path:  # WSL path
-                        subprocess.run(["powershell.exe", "taskkill", "/F", "/IM", "chrome.exe"], 
-                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    else:
-                        subprocess.run(["pkill", "-f", "chrome"], 
-                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                time.sleep(2)
+                chrome_instance = await checkout_chrome()
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="No Chrome instance available, try again later")
+            browser_config.chrome_instance_path = None  # Don't start a new Chrome
+            browser_config.playwright_cdp_url = chrome_instance.cdp_url
+        elif config.chrome_path:
+            # Stop the Chrome we launched earlier; it holds our debugging port and the profile.
+            # Every Chrome on the host is only killed when explicitly requested.
+            try:
+                killed = False
+                for pid in list(_our_chrome_pids):
+                    _our_chrome_pids.discard(pid)
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                        killed = True
+                    except OSError:
+                        pass  # Already gone
+                
+                kill_command = None
+                if config.force_kill_all_chrome:
+                    logger.info("Killing all Chrome processes...")
+                    if SYSTEM_TYPE == "Windows":
+                        kill_command = ["taskkill", "/F", "/IM", "chrome.exe"]
+                    elif SYSTEM_TYPE == "Linux":
+                        # For WSL or regular Linux
+                        if "/mnt/" in config.chrome_path:  # WSL path
+                            kill_command = ["powershell.exe", "taskkill", "/F", "/IM", "chrome.exe"]
+                        else:
+                            kill_command = ["pkill", "-f", "chrome"]
+                if kill_command:
+                    kill_process = await asyncio.create_subprocess_exec(
+                        *kill_command,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL
+                    )
+                    await kill_process.wait()
+                    killed = True
+                if killed:
+                    await asyncio.sleep(2)
             except Exception as e:
-                print(f"Failed to kill Chrome processes: {e}")
+                logger.warning("Failed to kill Chrome processes: %s", e)
             
             # Launch Chrome with debugging port
             try:
-                print(f"Launching Chrome from {config.chrome_path} with remote debugging...")
-                user_data_dir = os.path.join(os.path.expanduser("~"), ".chrome-automation-data")
-                os.makedirs(user_data_dir, exist_ok=True)
-                
-                chrome_args = [
-                    config.chrome_path,
-                    f"--remote-debugging-port=9222",
-                    "--no-first-run",
-                    "--no-default-browser-check",
-                    f"--user-data-dir={user_data_dir}",
-                    "about:blank"
-                ]
-                
-                # Use appropriate subprocess creation based on OS
-                if system_type == "Windows":
-                    # Use CREATE_NO_WINDOW flag to prevent console window
-                    from subprocess import CREATE_NO_WINDOW
-                    chrome_process = subprocess.Popen(
-                        chrome_args, 
-                        stdout=subprocess.PIPE, 
-                        stderr=subprocess.PIPE,
-                        creationflags=CREATE_NO_WINDOW
-                    )
-                else:
-                    chrome_process = subprocess.Popen(
-                        chrome_args, 
-                        stdout=subprocess.PIPE, 
-                        stderr=subprocess.PIPE
-                    )
+                logger.info("Launching Chrome from %s with remote debugging...", config.chrome_path)
+                port = worker_chrome_port()
+                chrome_process = await launch_chrome(config.chrome_path, port, worker_user_data_dir)
+                _our_chrome_pids.add(chrome_process.pid)
                 
-                # Give Chrome time to start up
-                time.sleep(5)
+                # Wait until Chrome accepts CDP connections instead of a fixed delay
+                cdp_url = f"http://localhost:{port}"
+                if not await wait_for_cdp(cdp_url, chrome_process):
+                    logger.warning("Chrome did not answer on port %s within %ss", port, CDP_READY_TIMEOUT)
                 
                 # Configure Browser to connect to the already running instance
                 browser_config.chrome_instance_path = None  # Don't start a new Chrome
-                browser_config.playwright_cdp_url = "http://localhost:9222"
+                browser_config.playwright_cdp_url = cdp_url
             except Exception as e:
-                print(f"Failed to manually launch Chrome: {e}")
-                traceback.print_exc()
+                logger.exception("Failed to manually launch Chrome: %s", e)
         
         # Initialize controller with improved error handling
         controller = Controller()
         
         # Register the action for user input with error handling
         @controller.action('Ask user for information')
-        def ask_human(question: str) -> str:
+        async def ask_human(question: str) -> str:
+            # Suspend the agent until /provide_input resolves the future with the answer
+            session = None
             try:
-                pending_inputs[session_id] = question
-                return ActionResult(extracted_content="Waiting for user input...")
+                future = asyncio.get_running_loop().create_future()
+                async with _sessions_lock:
+                    session = active_sessions.get(session_id)
+                    if session is None:
+                        return ActionResult(extracted_content="Session closed before the user could answer")
+                    session["input_future"] = future
+                async with _pending_lock:
+                    pending_inputs[session_id] = question
+                mark_changed(session_id)
+                
+                answer = await asyncio.wait_for(future, timeout=INPUT_TIMEOUT)
+                return ActionResult(extracted_content=answer)
+            except asyncio.TimeoutError:
+                async with _pending_lock:
+                    pending_inputs.pop(session_id, None)
+                mark_changed(session_id)
+                return ActionResult(extracted_content="The user did not answer in time")
             except Exception as e:
-                print(f"Error in ask_human action: {e}")
+                logger.exception("Error in ask_human action: %s", e)
                 return ActionResult(extracted_content=f"Error asking for user input: {str(e)}")
+            finally:
+                if session is not None:
+                    session["input_future"] = None
         
         # Initialize browser with proper error handling
         try:
-            browser = Browser(config=browser_config)
+            browser = await asyncio.to_thread(Browser, config=browser_config)
         except Exception as e:
             error_msg = f"Browser initialization failed: {str(e)}"
-            print(error_msg)
-            traceback.print_exc()
+            logger.exception(error_msg)
+            if chrome_instance:
+                await return_chrome(chrome_instance)
+            if chrome_process:
+                terminate_chrome(chrome_process.pid)
             raise HTTPException(status_code=500, detail=error_msg)
         
+        # Stop our Chrome if the Browser is garbage collected without /close,
+        # e.g. when the session is dropped on an error path, or at exit
+        if chrome_process:
+            weakref.finalize(browser, terminate_chrome, chrome_process.pid)
+        
         # Store session info
-        active_sessions[session_id] = {
-            "browser": browser,
-            "controller": controller,
-            "pending_task": None,
-            "is_running": False,
-            "chrome_process": chrome_process
-        }
+        async with _sessions_lock:
+            # A concurrent /initialize may have taken the same explicit id meanwhile
+            conflict = session_id in active_sessions
+            if not conflict:
+                active_sessions[session_id] = {
+                    "browser": browser,
+                    "controller": controller,
+                    "pending_task": None,
+                    "is_running": False,
+                    "chrome_process": chrome_process,
+                    "chrome_instance": chrome_instance,
+                    "task": None,
+                    "jobs": deque(),
+                    "scheduled": False,
+                    "queued": 0,
+                    "input_future": None,
+                    "step_subscribers": set(),
+                    "state_version": 0,
+                    "changed": asyncio.Event()
+                }
+            
+            # Over the cap, close the least recently used idle sessions
+            overflow = len(active_sessions) - MAX_SESSIONS
+            evicted = [
+                sid for sid, other in active_sessions.items()
+                if sid != session_id and not other["is_running"]
+            ][:max(0, overflow)]
+        
+        if conflict:
+            await browser.close()
+            if chrome_instance:
+                await return_chrome(chrome_instance)
+            elif chrome_process:
+                _our_chrome_pids.discard(chrome_process.pid)
+                chrome_process.terminate()
+            raise HTTPException(status_code=409, detail="Session id already in use")
+        
+        for sid in evicted:
+            logger.info("Session limit reached, closing idle session %s", sid)
+            try:
+                await close_session(sid)
+            except Exception as e:
+                logger.warning("Failed to close evicted session %s: %s", sid, e)
         
         return {"session_id": session_id, "status": "initialized"}
+    except HTTPException:
+        raise
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Browser initialization error: %s", e)
         raise HTTPException(status_code=500, detail=f"Browser initialization error: {str(e)}")
         
 @app.post("/run_task")
-async def run_task(task: BrowserTask, background_tasks: BackgroundTasks):
+async def run_task(task: BrowserTask):
     """Start a browser automation task"""
+    global queued_task_count
     try:
         session_id = task.session_id
-        if not session_id or session_id not in active_sessions:
-            raise HTTPException(status_code=404, detail="Session not found. Initialize a browser first.")
-        
-        session = active_sessions[session_id]
-        
-        # Check if a task is already running
-        if session["is_running"]:
-            raise HTTPException(status_code=400, detail="A task is already running in this session")
-        
-        # Store task in session for asynchronous execution
-        session["pending_task"] = task.task
-        session["is_running"] = True
-        
-        # Run task in background
-        background_tasks.add_task(execute_browser_task, session_id, task.task, task.max_steps)
+        async with _sessions_lock:
+            session = active_sessions.get(session_id) if session_id else None
+            if session is None:
+                raise HTTPException(status_code=404, detail="Session not found. Initialize a browser first.")
+            
+            if queued_task_count >= MAX_QUEUED_TASKS:
+                raise HTTPException(status_code=503, detail="Task queue is full, try again later")
+            
+            # Queue the task; the session counts as running until its queue is empty
+            task_id = uuid.uuid4().hex
+            session["jobs"].append({
+                "task_id": task_id,
+                "session_id": session_id,
+                "task": task.task,
+                "max_steps": task.max_steps
+            })
+            queued_task_count += 1
+            task_records[task_id] = {"task_id": task_id, "session_id": session_id, "state": "queued"}
+            while len(task_records) > MAX_TASK_RECORDS:
+                task_records.popitem(last=False)
+            if not session["scheduled"]:
+                session["scheduled"] = True
+                task_queue.put_nowait(session_id)
+            
+            active_sessions.move_to_end(session_id)
+            session["queued"] += 1
+            session["pending_task"] = task.task
+            session["is_running"] = True
+            mark_changed(session_id)
+            # Status frames for this task carry a higher version than this one
+            state_version = session["state_version"]
         
         return {
             "session_id": session_id,
+            "task_id": task_id,
+            "state_version": state_version,
             "status": "task_started",
-            "message": "Browser automation task started. Check status endpoint for updates."
+            "message": "Browser automation task queued. Check status endpoint for updates."
         }
     except HTTPException:
         raise
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error starting task: %s", e)
         raise HTTPException(status_code=500, detail=f"Error starting task: {str(e)}")
 
-async def execute_browser_task(session_id: str, task: str, max_steps: int = 50):
-    """Execute a browser automation task with improved error handling"""
+@app.get("/task_status/{task_id}")
+async def task_status(task_id: str):
+    """State of a queued task: queued, running, completed, timed_out_with_partial, failed or cancelled"""
+    record = task_records.get(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return record
+
+def set_task_state(task_id: str, state: str, error: Optional[str] = None):
+    record = task_records.get(task_id)
+    if record is not None:
+        record["state"] = state
+        if error:
+            record["error"] = error
+
+def cancel_queued_jobs(session: Dict[str, Any]):
+    """Mark the tasks still waiting in a closed session's FIFO as cancelled"""
+    global queued_task_count
+    while session["jobs"]:
+        job = session["jobs"].popleft()
+        queued_task_count -= 1
+        set_task_state(job["task_id"], "cancelled", "Session closed before the task started")
+
+async def run_next_job(session_id: str):
+    """
+    Run the oldest queued task of a session and settle its session state.
+    Only one worker holds a session at a time; if more tasks are waiting it
+    goes back to the end of task_queue so other sessions get their turn.
+    """
+    global queued_task_count
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+        if session is None or not session["jobs"]:
+            return
+        job = session["jobs"].popleft()
+        queued_task_count -= 1
+    task_id = job["task_id"]
+    
+    try:
+        set_task_state(task_id, "running")
+        await update_session(session_id, pending_task=job["task"], last_result=None, last_error=None)
+        
+        # Run as its own task so /close can cancel it without stopping the worker
+        run = spawn(execute_browser_task(session_id, job["task"], job["max_steps"], task_id))
+        session["task"] = run
+        outcome, = await asyncio.gather(run, return_exceptions=True)
+    finally:
+        session["task"] = None
+        async with _sessions_lock:
+            session["queued"] -= 1
+            session["is_running"] = session["queued"] > 0
+            mark_changed(session_id)
+            if session["jobs"] and session_id in active_sessions:
+                task_queue.put_nowait(session_id)
+            else:
+                session["scheduled"] = False
+    
+    error = None
+    if isinstance(outcome, asyncio.CancelledError):
+        state = "cancelled"
+    elif isinstance(outcome, Exception):
+        state, error = "failed", str(outcome)
+    elif isinstance(outcome, dict) and "error" in outcome:
+        state, error = "failed", outcome["error"]
+    elif isinstance(outcome, dict) and outcome.get("status") == "partial":
+        state = "timed_out_with_partial"
+    else:
+        state = "completed"
+    set_task_state(task_id, state, error)
+    publish_event(session, {"type": "task_finished", "task_id": task_id, "state": state, "error": error})
+
+async def task_worker():
+    """Drain task_queue for the lifetime of the service"""
+    while True:
+        session_id = await task_queue.get()
+        try:
+            await run_next_job(session_id)
+        except Exception as e:
+            logger.exception("Task for session %s failed in worker: %s", session_id, e)
+        finally:
+            task_queue.task_done()
+
+@app.post("/initialize_and_run")
+async def initialize_and_run(config: BrowserTask):
+    """Initialize a browser session and start its first task in one request"""
+    session = await initialize_browser(config)
+    config.session_id = session["session_id"]
+    try:
+        started = await run_task(config)
+    except Exception:
+        # The client never learns the session id on failure, so don't leave it behind
+        try:
+            await close_session(session["session_id"])
+        except HTTPException:
+            pass  # Already closed by someone else
+        raise
+    return {**started, "task_started": True}
+
+# LLM requests in flight across all sessions; parallel agents wait here instead of
+# tripping provider rate limits and retrying in lockstep
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "8"))
+_llm_sem = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+class _BoundedLLM:
+    """Mixin that runs every async generation under _llm_sem"""
+    async def _agenerate(self, *args, **kwargs):
+        async with _llm_sem:
+            return await super()._agenerate(*args, **kwargs)
+
+class BoundedChatGoogleGenerativeAI(_BoundedLLM, ChatGoogleGenerativeAI):
+    pass
+
+class BoundedChatOpenAI(_BoundedLLM, ChatOpenAI):
+    pass
+
+@lru_cache(maxsize=8)
+def get_llms(gemini_api_key: str, openrouter_api_key: str):
+    """Build the agent and planner LLMs once per key pair so tasks reuse their HTTP clients"""
+    llm = BoundedChatGoogleGenerativeAI(
+        model='gemini-2.0-flash-exp', 
+        api_key=SecretStr(gemini_api_key)
+    )
+    
+    planner_llm = BoundedChatOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        model="google/gemma-3-27b-it:free",
+        api_key=SecretStr(openrouter_api_key),
+    )
+    
+    # planner_llm=ChatGoogleGenerativeAI(
+    #     model='gemini-2.0-flash-lite',
+    #     api_key=SecretStr(gemini_api_key)
+    # )
+    
+    return llm, planner_llm
+
+# At the soft deadline the agent is asked to stop after its current step and the steps
+# so far are kept as a partial result; the hard deadline cancels it outright
+SOFT_TASK_DEADLINE = 540
+HARD_TASK_DEADLINE = 600
+
+async def execute_browser_task(session_id: str, task: str, max_steps: int = 50,
+                               task_id: Optional[str] = None):
+    """Execute a browser automation task, publishing each step to the session's step streams"""
     try:
-        if session_id not in active_sessions:
-            print(f"Session {session_id} not found in active_sessions")
+        async with _sessions_lock:
+            session = active_sessions.get(session_id)
+        if session is None:
+            logger.warning("Session %s not found in active_sessions", session_id)
             return
             
-        session = active_sessions[session_id]
         browser = session["browser"]
         controller = session["controller"]
         
         # Initialize LLMs with proper error handling
         try:
-            llm = ChatGoogleGenerativeAI(
-                model='gemini-2.0-flash-exp', 
-                api_key=SecretStr(GEMINI_API_KEY)
-            )
-            
-            planner_llm = ChatOpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                model="google/gemma-3-27b-it:free",
-                api_key=SecretStr(OPENROUTER_API_KEY),
-            )
-            
-            # planner_llm=ChatGoogleGenerativeAI(
-            #     model='gemini-2.0-flash-lite',
-            #     api_key=SecretStr(GEMINI_API_KEY)
-            # )
-
+            llm, planner_llm = get_llms(GEMINI_API_KEY, OPENROUTER_API_KEY)
         except Exception as e:
-            print(f"Error initializing LLMs: {e}")
-            traceback.print_exc()
-            session["is_running"] = False
-            session["last_error"] = f"LLM initialization error: {str(e)}"
+            logger.exception("Error initializing LLMs: %s", e)
+            await update_session(session_id, last_error=f"LLM initialization error: {str(e)}")
             return
         
         # Create the agent with timeout handling
@@ -245,147 +841,349 @@ async def execute_browser_task(session_id: str, task: str, max_steps: int = 50):
                 browser=browser,
                 use_vision=True,
                 planner_llm=planner_llm,
-                controller=controller
+                controller=controller,
+                register_new_step_callback=lambda state, model_output, step_number: publish_event(
+                    session, step_event(task_id, state, model_output, step_number)
+                )
             )
             
-            # Run the agent with timeout protection
-            import asyncio
-
-            result = await asyncio.wait_for(
-                agent.run(max_steps=max_steps), 
-                timeout=600  # 10 minute timeout
-            )
+            # Stop cooperatively between steps at the soft deadline; wait_for is only the safety net
+            soft_deadline_hit = False
+            def stop_at_soft_deadline():
+                nonlocal soft_deadline_hit
+                soft_deadline_hit = True
+                agent.stop()
+            
+            stopper = None
+            if hasattr(agent, "stop"):
+                stopper = asyncio.get_running_loop().call_later(SOFT_TASK_DEADLINE, stop_at_soft_deadline)
+            try:
+                result = await asyncio.wait_for(agent.run(max_steps=max_steps), timeout=HARD_TASK_DEADLINE)
+            finally:
+                if stopper:
+                    stopper.cancel()
+            
+            if soft_deadline_hit:
+                logger.warning("Session %s: task stopped at the soft deadline, keeping partial result", session_id)
+                # Same shape as a full result, history included, plus the partial marker
+                retained = await retain_result(session_id, result)
+                if not isinstance(retained, dict):
+                    retained = {"result": retained}
+                partial = {**retained, "status": "partial"}
+                await update_session(session_id, last_result=partial)
+                return partial
             
             # Update session status
-            session["is_running"] = False
-            session["last_result"] = result
+            await update_session(session_id, last_result=await retain_result(session_id, result))
             
             return result
         except asyncio.TimeoutError:
             error_msg = "Browser automation task timed out after 10 minutes"
-            session["is_running"] = False
-            session["last_error"] = error_msg
-            print(error_msg)
+            await update_session(session_id, last_error=error_msg)
+            logger.warning("Session %s: %s", session_id, error_msg)
             return {"error": error_msg}
         except Exception as e:
-            session["is_running"] = False
-            session["last_error"] = str(e)
-            traceback.print_exc()
+            await update_session(session_id, last_error=str(e))
+            logger.exception("Browser task failed in session %s: %s", session_id, e)
             return {"error": str(e)}
     except Exception as e:
         # Update session status even if there's an error
-        if session_id in active_sessions:
-            active_sessions[session_id]["is_running"] = False
-            active_sessions[session_id]["last_error"] = str(e)
-        traceback.print_exc()
+        await update_session(session_id, last_error=str(e))
+        logger.exception("Error executing task in session %s: %s", session_id, e)
         raise e
 
 @app.get("/status/{session_id}")
-async def get_status(session_id: str):
-    """Get the status of a browser session"""
-    if session_id not in active_sessions:
+async def get_status(session_id: str, wait: float = 0, etag: Optional[str] = None,
+                     fields: Optional[str] = None,
+                     if_none_match: Optional[str] = Header(None)):
+    """
+    Get the status of a browser session. A known etag, from the query or
+    If-None-Match, gets a 304 when nothing changed; with wait the request is
+    first held until the state changes or wait runs out. fields limits the
+    response to the listed keys, without screenshots.
+    """
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = active_sessions[session_id]
+    known = etag or if_none_match
+    async with _pending_lock:
+        expire_pending_inputs()
+    # Long-poll: hold the request until something changes; the lock is not held while waiting
+    if wait > 0 and known == status_etag(session_id, session, fields):
+        try:
+            await asyncio.wait_for(session["changed"].wait(), timeout=min(wait, MAX_STATUS_WAIT))
+        except asyncio.TimeoutError:
+            return Response(status_code=304, headers={"ETag": known})
+        async with _sessions_lock:
+            if session_id not in active_sessions:
+                raise HTTPException(status_code=404, detail="Session not found")
     
-    # Check if there's a pending input question
-    pending_question = pending_inputs.get(session_id)
+    async with _pending_lock:
+        expire_pending_inputs()
+        current = status_etag(session_id, session, fields)
+        if known == current:
+            return Response(status_code=304, headers={"ETag": current})
+        body = encoded_status(session_id, session, fields)
+    return Response(content=body, media_type="application/json", headers={"ETag": current})
+
+@app.websocket("/ws/{session_id}")
+async def status_websocket(websocket: WebSocket, session_id: str, fields: Optional[str] = None):
+    """Push a status_update to the client every time the session changes"""
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
     
-    return {
-        "session_id": session_id,
-        "is_running": session["is_running"],
-        "pending_task": session["pending_task"],
-        "needs_input": pending_question is not None,
-        "pending_question": pending_question,
-        "last_result": session.get("last_result"),
-        "last_error": session.get("last_error")
-    }
+    await websocket.accept()
+    try:
+        while session is not None:
+            # Grab the event before sending so a change during the send isn't missed
+            changed = session["changed"]
+            async with _pending_lock:
+                status = encoded_status(session_id, session, fields)
+            await websocket.send_text(orjson.dumps({
+                "type": "status_update",
+                "status": orjson.Fragment(status)
+            }).decode())
+            await changed.wait()
+            async with _sessions_lock:
+                session = active_sessions.get(session_id)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@app.websocket("/ws/status/{session_id}")
+async def step_websocket(websocket: WebSocket, session_id: str):
+    """Stream every agent step as it is produced, and a task_finished event per task"""
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    events = asyncio.Queue(maxsize=STEP_QUEUE_SIZE)
+    session["step_subscribers"].add(events)
+    try:
+        # None is published when the session closes
+        while (event := await events.get()) is not None:
+            await websocket.send_text(orjson.dumps(event).decode())
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session["step_subscribers"].discard(events)
 
 @app.post("/provide_input/{session_id}")
 async def provide_input(session_id: str, response: UserInputResponse):
     """Provide user input for a pending question"""
-    if session_id not in active_sessions:
+    async with _sessions_lock:
+        session = active_sessions.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    if session_id not in pending_inputs:
-        raise HTTPException(status_code=400, detail="No pending input request for this session")
-    
-    # Update the controller's action to return the provided answer
-    controller = active_sessions[session_id]["controller"]
-    
-    @controller.action('Ask user for information')
-    def ask_human(question: str) -> str:
-        return ActionResult(extracted_content=response.answer)
-    
-    # Clear the pending input
-    del pending_inputs[session_id]
+    async with _pending_lock:
+        # Clearing the pending input doubles as the check that there is one
+        future = session.get("input_future")
+        if future is None or future.done() or pending_inputs.pop(session_id, None) is None:
+            raise HTTPException(status_code=400, detail="No pending input request for this session")
+        
+        # Hand the answer to the waiting ask_human action
+        future.set_result(response.answer)
+    mark_changed(session_id)
     
     return {"status": "input_provided", "session_id": session_id}
 
+@app.post("/batch")
+async def batch(calls: List[BatchCall]):
+    """
+    Run several status/input calls in one request. Results come back in
+    call order as {"status_code", "body"} or {"status_code", "detail"}.
+    """
+    results = []
+    for call in calls:
+        parts = urlsplit(call.path.lstrip("/"))
+        route, _, session_id = parts.path.partition("/")
+        params = dict(parse_qsl(parts.query))
+        method = call.method.upper()
+        try:
+            if method == "GET" and route == "status":
+                status_response = await get_status(session_id, fields=params.get("fields"), if_none_match=None)
+                results.append({
+                    "status_code": 200,
+                    "etag": status_response.headers.get("ETag"),
+                    "body": orjson.Fragment(status_response.body)
+                })
+            elif method == "POST" and route == "provide_input":
+                body = await provide_input(session_id, UserInputResponse(**(call.body or {})))
+                results.append({"status_code": 200, "body": body})
+            else:
+                results.append({"status_code": 404, "detail": f"Unsupported batch call: {method} {call.path}"})
+        except HTTPException as e:
+            results.append({"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.exception("Batch call %s %s failed: %s", method, call.path, e)
+            results.append({"status_code": 500, "detail": str(e)})
+    # Returned as a response so the pre-encoded status bodies are embedded as they are
+    return ORJSONResponse(results)
+
 @app.post("/close/{session_id}")
 async def close_session(session_id: str):
     """Close a browser session with improved cleanup"""
-    if session_id not in active_sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
+    # Take the session out first so concurrent calls can't close it twice;
+    # the woken status waiters re-check under the lock and see it gone
+    async with _sessions_lock:
+        session = active_sessions.pop(session_id, None)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        bump_state(session)
+        cancel_queued_jobs(session)
+    publish_event(session, None)
+    async with _pending_lock:
+        pending_inputs.pop(session_id, None)
     
     try:
-        session = active_sessions[session_id]
         browser = session["browser"]
         
+        # Stop a running agent first so it releases the browser
+        await cancel_task(session.get("task"))
+        
         # Close the browser
         await browser.close()
         
-        # Terminate Chrome process with proper error handling
-        if session.get("chrome_process"):
+        # Pooled Chrome goes back to the pool; one we launched ourselves is terminated
+        if session.get("chrome_instance"):
+            await return_chrome(session["chrome_instance"])
+        elif session.get("chrome_process"):
+            _our_chrome_pids.discard(session["chrome_process"].pid)
             try:
-                import platform
-                system_type = platform.system()
-                
                 # Use appropriate termination method based on OS
-                if system_type == "Windows":
-                    import ctypes
+                if SYSTEM_TYPE == "Windows":
                     # Use handle to terminate process more reliably on Windows
                     process = session["chrome_process"]
-                    if process.poll() is None:  # Process is still running
+                    if process.returncode is None:  # Process is still running
                         process.terminate()
                         # Give it a moment to terminate gracefully
-                        import time
-                        time.sleep(1)
-                        # If still running, kill forcefully
-                        if process.poll() is None:
+                        try:
+                            await asyncio.wait_for(process.wait(), timeout=1)
+                        except asyncio.TimeoutError:
+                            # If still running, kill forcefully
                             process.kill()
                 else:
                     session["chrome_process"].terminate()
             except Exception as e:
-                print(f"Error terminating Chrome process: {e}")
-        
-        # Remove the session
-        del active_sessions[session_id]
-        
-        # Clean up any pending inputs
-        if session_id in pending_inputs:
-            del pending_inputs[session_id]
+                logger.warning("Error terminating Chrome process: %s", e)
         
         return {"status": "closed", "session_id": session_id}
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error closing session %s: %s", session_id, e)
         raise HTTPException(status_code=500, detail=f"Error closing session: {str(e)}")
     
     
+@app.on_event("startup")
+async def start_logging():
+    """Route service logs through a queue drained by a background listener thread"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    _log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+@app.on_event("startup")
+async def start_task_workers():
+    """Start the workers that run queued tasks"""
+    for _ in range(N_WORKERS):
+        task_workers.append(spawn(task_worker()))
+
+@app.on_event("startup")
+async def start_chrome_pool():
+    """Claim this worker's port slot and pre-launch its warm Chrome pool when CHROME_PATH is configured"""
+    global chrome_pool
+    claim_worker_slot()
+    if not CHROME_PATH or CHROME_POOL_SIZE <= 0:
+        return
+    
+    chrome_pool = asyncio.Queue()
+    pool_size = min(CHROME_POOL_SIZE, CHROME_PORTS_PER_WORKER - 1)
+    user_data_dirs = [
+        f"{USER_DATA_DIR}-{worker_slot * CHROME_PORTS_PER_WORKER + i}" for i in range(pool_size)
+    ]
+    for user_data_dir in user_data_dirs:
+        os.makedirs(user_data_dir, exist_ok=True)
+    instances = await asyncio.gather(*(
+        start_pooled_chrome(worker_chrome_port(i), user_data_dir)
+        for i, user_data_dir in enumerate(user_data_dirs)
+    ), return_exceptions=True)
+    for instance in instances:
+        if isinstance(instance, Exception):
+            logger.error("Failed to start pooled Chrome: %s", instance)
+        else:
+            chrome_pool.put_nowait(instance)
+    logger.info("Chrome pool for worker slot %s ready with %s instance(s)", worker_slot, chrome_pool.qsize())
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close all browser sessions when shutting down"""
-    for session_id in list(active_sessions.keys()):
+    for worker in task_workers:
+        worker.cancel()
+    
+    async with _sessions_lock:
+        sessions = list(active_sessions.values())
+        active_sessions.clear()
+    
+    for session in sessions:
+        cancel_queued_jobs(session)
+        publish_event(session, None)
         try:
-            await active_sessions[session_id]["browser"].close()
+            await cancel_task(session.get("task"))
+            await session["browser"].close()
             # Terminate Chrome process if we launched it manually
-            if active_sessions[session_id].get("chrome_process"):
+            if session.get("chrome_process"):
                 try:
-                    active_sessions[session_id]["chrome_process"].terminate()
+                    _our_chrome_pids.discard(session["chrome_process"].pid)
+                    session["chrome_process"].terminate()
                 except:
                     pass
         except:
             pass
+    
+    # Pooled instances are only ever terminated here
+    instances = [session["chrome_instance"] for session in sessions if session.get("chrome_instance")]
+    while chrome_pool is not None and not chrome_pool.empty():
+        instances.append(chrome_pool.get_nowait())
+    for instance in instances:
+        try:
+            instance.process.terminate()
+        except:
+            pass
+    
+    # Flush queued log records before the process exits
+    if _log_listener is not None:
+        _log_listener.stop()
+
+# Sessions live in each worker's memory, so with SERVICE_WORKERS > 1 every request for a
+# session must reach the worker that created it: put a sticky (session-affine) load
+# balancer in front, or move session state out of process before raising the default
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
 
 if __name__ == "__main__":
-    uvicorn.run("browser_service:app", host="0.0.0.0", port=8000, reload=False)
+    # "auto" picks uvloop and httptools when installed (uvicorn[standard]). uvloop has no
+    # Windows build, and Chrome launching there needs the default Proactor loop
+    uvicorn.run(
+        "browser_service:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=False,
+        workers=SERVICE_WORKERS,
+        loop="auto",
+        http="auto"
+    )
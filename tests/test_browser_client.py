@@ -0,0 +1,42 @@
+import logging
+import unittest
+
+from browser_client import BrowserAutomationClient
+
+
+def make_client():
+    # _clean_result needs no connection state, only a logger
+    client = BrowserAutomationClient.__new__(BrowserAutomationClient)
+    client.logger = logging.getLogger("BrowserAutomationClient")
+    return client
+
+
+HISTORY = [
+    {
+        "model_output": {"action": [{"go_to_url": {"url": "https://example.com"}}]},
+        "result": [{"extracted_content": "Opened example.com"}],
+    },
+    {
+        "model_output": {"action": [{"click": {"element": {"text": "Search"}}}]},
+        "result": [],
+    },
+]
+
+
+class CleanResultTest(unittest.TestCase):
+    def test_full_history_is_summarised(self):
+        text = make_client()._clean_result({"history": HISTORY})
+        self.assertTrue(text.startswith("Task completed with the following steps:"))
+        self.assertIn("• Navigated to https://example.com → Opened example.com", text)
+        self.assertIn("• Performed click on 'Search'", text)
+
+    def test_partial_result_is_summarised_not_dumped(self):
+        partial = {"history": HISTORY, "status": "partial"}
+        text = make_client()._clean_result(partial)
+        self.assertTrue(text.startswith("Task stopped at the time limit after the following steps:"))
+        self.assertIn("• Navigated to https://example.com → Opened example.com", text)
+        self.assertNotIn('"model_output"', text)
+
+
+if __name__ == "__main__":
+    unittest.main()